@@ -222,6 +222,8 @@ class GetDefaultRelValStepAPI(APIBase):
 class RelValNextStatus(APIBase):
     """
     Endpoint for moving one or multiple RelVals to next status
+    RelVal dicts can have "submission_priority" that is used when RelVal is
+    added to the submission queue
     """
 
     def __init__(self):
@@ -236,10 +238,14 @@ class RelValNextStatus(APIBase):
         """
         data = flask.request.data
         relval_json = json.loads(data.decode('utf-8'))
+        priorities = {}
         if isinstance(relval_json, dict):
             prepid = relval_json.get('prepid')
             relval = relval_controller.get(prepid)
-            results = relval_controller.next_status([relval])
+            if relval_json.get('submission_priority') is not None:
+                priorities[prepid] = int(relval_json['submission_priority'])
+
+            results = relval_controller.next_status([relval], priorities)
             results = results[0].get_json()
         elif isinstance(relval_json, list):
             relvals = []
@@ -247,8 +253,10 @@ class RelValNextStatus(APIBase):
                 prepid = single_relval_json.get('prepid')
                 relval = relval_controller.get(prepid)
                 relvals.append(relval)
+                if single_relval_json.get('submission_priority') is not None:
+                    priorities[prepid] = int(single_relval_json['submission_priority'])
 
-            results = relval_controller.next_status(relvals)
+            results = relval_controller.next_status(relvals, priorities)
             results = [x.get_json() for x in results]
         else:
             raise Exception('Expected a single RelVal dict or a list of RelVal dicts')
@@ -1,16 +1,23 @@
 """
 Module that contains all system APIs
 """
+import flask
 from core_lib.api.api_base import APIBase
 from core_lib.utils.locker import Locker
 from core_lib.database.database import Database
 from core_lib.utils.user_info import UserInfo
 from core.utils.submitter import RequestSubmitter
+from core.utils.config_cache import ConfigCache
+from core.utils.submission_metrics import SubmissionMetrics
+from core.utils.host_balancer import HostBalancer
+from core.utils.rate_limiter import RateLimiter
+from core.utils.worker_autoscaler import WorkerAutoscaler
+from core.controller.relval_controller import RelValController
 
 
 class SubmissionWorkerStatusAPI(APIBase):
     """
-    Endpoint for getting submission workers status
+    Endpoint for getting submission workers status and worker autoscaling decisions
     """
 
     def __init__(self):
@@ -19,15 +26,17 @@ class SubmissionWorkerStatusAPI(APIBase):
     @APIBase.exceptions_to_errors
     def get(self):
         """
-        Get status of all request submission workers
+        Get status of all request submission workers, signals and bounds that
+        number of workers of each stage is based on and recent changes of it
         """
-        status = RequestSubmitter().get_worker_status()
+        status = {'workers': RequestSubmitter().get_worker_status(),
+                  'autoscaler': WorkerAutoscaler().get_status()}
         return self.output_text({'response': status, 'success': True, 'message': ''})
 
 
 class SubmissionQueueAPI(APIBase):
     """
-    Endpoint for getting names in submission queue
+    Endpoint for getting RelVals in submission queue and depth of each submission stage
     """
 
     def __init__(self):
@@ -36,9 +45,104 @@ class SubmissionQueueAPI(APIBase):
     @APIBase.exceptions_to_errors
     def get(self):
         """
-        Get status of all request submission workers
+        Get RelVals, their stages, priorities, positions and estimated start times
+        in persistent submission queue and number of queued and active jobs of each stage
         """
-        status = RequestSubmitter().get_names_in_queue()
+        submitter = RequestSubmitter()
+        status = {'queue': submitter.get_names_in_queue(),
+                  'stages': submitter.get_stages_status()}
+        return self.output_text({'response': status, 'success': True, 'message': ''})
+
+
+class CancelSubmissionAPI(APIBase):
+    """
+    Endpoint for cancelling submission of a RelVal
+    """
+
+    def __init__(self):
+        APIBase.__init__(self)
+
+    @APIBase.exceptions_to_errors
+    @APIBase.ensure_role('administrator')
+    def post(self, prepid):
+        """
+        Cancel queued or running submission of a RelVal
+        """
+        state = RequestSubmitter().cancel(prepid, RelValController())
+        return self.output_text({'response': state, 'success': True, 'message': ''})
+
+
+class ConfigCacheStatusAPI(APIBase):
+    """
+    Endpoint for getting config cache hit ratio of each campaign
+    """
+
+    def __init__(self):
+        APIBase.__init__(self)
+
+    @APIBase.exceptions_to_errors
+    def get(self):
+        """
+        Get number of config cache hits, misses and hit ratio of each campaign
+        """
+        stats = ConfigCache().get_stats()
+        return self.output_text({'response': stats, 'success': True, 'message': ''})
+
+
+class SubmissionMetricsAPI(APIBase):
+    """
+    Endpoint for getting durations of submission stages
+    """
+
+    def __init__(self):
+        APIBase.__init__(self)
+
+    @APIBase.exceptions_to_errors
+    def get(self):
+        """
+        Get p50/p95/p99 durations of each submission stage by CMSSW release,
+        stage breakdown of recent RelVals or a RelVal given as prepid argument
+        and number of retries of operations that failed with transient errors
+        """
+        prepid = flask.request.args.get('prepid')
+        metrics = SubmissionMetrics()
+        response = {'stages': metrics.get_histograms(),
+                    'relvals': metrics.get_relval_breakdown(prepid),
+                    'retries': metrics.get_retries()}
+        return self.output_text({'response': response, 'success': True, 'message': ''})
+
+
+class RemoteHostsStatusAPI(APIBase):
+    """
+    Endpoint for getting usage and health of remote execution hosts
+    """
+
+    def __init__(self):
+        APIBase.__init__(self)
+
+    @APIBase.exceptions_to_errors
+    def get(self):
+        """
+        Get number of used slots, cap, consecutive failures and health of each host
+        """
+        status = HostBalancer().get_status()
+        return self.output_text({'response': status, 'success': True, 'message': ''})
+
+
+class RateLimiterStatusAPI(APIBase):
+    """
+    Endpoint for getting usage of rate limits of upstream services
+    """
+
+    def __init__(self):
+        APIBase.__init__(self)
+
+    @APIBase.exceptions_to_errors
+    def get(self):
+        """
+        Get limits, requests in flight, waiting requests and wait times of each host
+        """
+        status = RateLimiter().get_status()
         return self.output_text({'response': status, 'success': True, 'message': ''})
 
 
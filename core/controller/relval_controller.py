@@ -6,12 +6,15 @@ import time
 import itertools
 from core_lib.database.database import Database
 from core_lib.controller.controller_base import ControllerBase
-from core_lib.utils.ssh_executor import SSHExecutor
-from core_lib.utils.connection_wrapper import ConnectionWrapper
 from core_lib.utils.global_config import Config
 from core_lib.utils.cache import TimeoutCache
-from core_lib.utils.common_utils import clean_split, cmssw_setup, get_scram_arch
+from core_lib.utils.common_utils import clean_split, get_scram_arch
 from core.utils.submitter import RequestSubmitter
+from core.utils.executor_pool import ExecutorPool
+from core.utils.retrying_connection import RetryingConnectionWrapper
+from core.utils.reqmgr_client import ReqMgrClient
+from core.utils.remote_job import RemoteJob
+from core.utils.cmssw_area_cache import CMSSWAreaCache
 from core.model.ticket import Ticket
 from core.model.relval import RelVal
 from core.model.relval_step import RelValStep
@@ -94,6 +97,7 @@ class RelValController(ControllerBase):
         editing_info['workflow_id'] = False
         editing_info['workflow_name'] = creating_new
         editing_info['steps'] = is_new
+        editing_info['submission_checkpoint'] = False
 
         return editing_info
 
@@ -115,25 +119,28 @@ class RelValController(ControllerBase):
                 ticket.add_history('remove_relval', prepid, None)
                 tickets_db.save(ticket.get_json())
 
-    def get_cmsdriver(self, relval, for_submission=False):
+    def get_cmsdriver(self, relval, for_submission=False, skip_configs=None):
         """
         Get bash script with cmsDriver commands for a given RelVal
         If script will be used for submission, replace input file with placeholder
+        Steps whose config names are in skip_configs are left out
         """
         self.logger.debug('Getting cmsDriver commands for %s', relval.get_prepid())
         cms_driver = '#!/bin/bash\n\n'
-        cms_driver += relval.get_cmsdrivers(for_submission)
+        cms_driver += relval.get_cmsdrivers(for_submission, skip_configs)
         cms_driver += '\n\n'
 
         return cms_driver
 
-    def get_config_upload_file(self, relval):
+    def get_config_upload_file(self, relval, for_batch=False, skip_configs=None):
         """
         Get bash script that would upload config files to ReqMgr2
+        If script will be part of a batch, it relies on WMCore and CMSSW set up by batch script
+        Steps whose config names are in skip_configs are left out
         """
         self.logger.debug('Getting config upload script for %s', relval.get_prepid())
         upload_command = '#!/bin/bash\n\n'
-        upload_command += relval.get_config_upload()
+        upload_command += relval.get_config_upload(for_batch, skip_configs)
         upload_command += '\n\n'
 
         return upload_command
@@ -293,21 +300,21 @@ class RelValController(ControllerBase):
             }
         }
         """
-        credentials_file = Config.get('credentials_path')
-        ssh_executor = SSHExecutor('lxplus.cern.ch', credentials_file)
         remote_directory = Config.get('remote_path').rstrip('/')
-        # Upload python script to resolve auto globaltag by upload script
-        ssh_executor.upload_file('./core/utils/resolveAutoGlobalTag.py',
-                                 f'{remote_directory}/resolveAutoGlobalTag.py')
-
-        command = [f'cd {remote_directory}']
+        remote_directory = f'{remote_directory}/globaltags-{int(time.time() * 1000)}'
+        script = []
         for cmssw_version, conditions in conditions_tree.items():
             # Setup CMSSW environment
-            command.extend(cmssw_setup(cmssw_version).split('\n'))
+            script.extend(CMSSWAreaCache().get_setup_script(cmssw_version).split('\n'))
             conditions_string = ','.join(list(conditions.keys()))
-            command += [f'python resolveAutoGlobalTag.py "{cmssw_version}" "{conditions_string}"']
+            script += [f'python resolveAutoGlobalTag.py "{cmssw_version}" "{conditions_string}"']
+
+        # Python script to resolve auto globaltags is sent together with the command
+        job = RemoteJob(remote_directory)
+        job.add_helper('resolveAutoGlobalTag.py', './core/utils/resolveAutoGlobalTag.py')
+        with ExecutorPool().borrow() as executor:
+            stdout, stderr, exit_code, _ = job.run(executor, script, retry=True)
 
-        stdout, stderr, exit_code = ssh_executor.execute_command(command)
         if exit_code != 0:
             self.logger.error('Error resolving auto global tags:\nstdout:%s\nstderr:%s',
                               stdout,
@@ -343,9 +350,10 @@ class RelValController(ControllerBase):
         relval.add_history('status', status, None, timestamp)
         relval_db.save(relval.get_json())
 
-    def next_status(self, relvals):
+    def next_status(self, relvals, priorities=None):
         """
         Trigger list of RelVals to move to next status
+        Priorities is an optional dictionary of prepids and their submission priorities
         """
         by_status = {}
         for relval in relvals:
@@ -362,7 +370,8 @@ class RelValController(ControllerBase):
                 results.extend(self.move_relvals_to_approved(relvals_with_status))
 
             elif status == 'approved':
-                results.extend(self.move_relvals_to_submitting(relvals_with_status))
+                results.extend(self.move_relvals_to_submitting(relvals_with_status,
+                                                               priorities))
 
             elif status == 'submitting':
                 raise Exception('Cannot move RelVals that are being submitted to next status')
@@ -449,8 +458,20 @@ class RelValController(ControllerBase):
                 self.update_status(relval, 'approved')
                 results.append(relval)
 
+        if Config.get('speculative_config_generation'):
+            RequestSubmitter().speculate(results, self)
+
         return results
 
+    def datasets_recently_checked(self, relval):
+        """
+        Return whether datasets of RelVal were checked during a previous submission
+        attempt and the check is still recent enough to be reused
+        """
+        checked = relval.get('submission_checkpoint').get('datasets', 0)
+        lifetime = int(Config.get('dataset_check_lifetime') or 86400)
+        return checked > time.time() - lifetime
+
     def get_dataset_access_types(self, relvals):
         """
         Return a dictionary of dataset access types
@@ -476,9 +497,11 @@ class RelValController(ControllerBase):
 
         grid_cert = Config.get('grid_user_cert')
         grid_key = Config.get('grid_user_key')
-        dbs_conn = ConnectionWrapper(host='cmsweb.cern.ch',
-                                     cert_file=grid_cert,
-                                     key_file=grid_key)
+        # Dataset list query is a POST request that does not change anything
+        dbs_conn = RetryingConnectionWrapper(host='cmsweb.cern.ch',
+                                             cert_file=grid_cert,
+                                             key_file=grid_key,
+                                             repeatable_methods=('GET', 'POST'))
         self.logger.info('Will check datasets: %s', datasets_to_check)
         dbs_response = dbs_conn.api('POST',
                                     '/dbs/prod/global/DBSReader/datasetlist',
@@ -500,12 +523,17 @@ class RelValController(ControllerBase):
 
         return dataset_access_types
 
-    def move_relvals_to_submitting(self, relvals):
+    def move_relvals_to_submitting(self, relvals, priorities=None):
         """
         Try to add RelVals to submission queue and get sumbitted
+        RelVals without given priority get priority derived from campaign and user's role
         """
+        priorities = priorities or {}
         results = []
-        dataset_access_types = self.get_dataset_access_types(relvals)
+        # Datasets that were checked in a recent failed submission are not checked again
+        to_check = [r for r in relvals if not self.datasets_recently_checked(r)]
+        dataset_access_types = self.get_dataset_access_types(to_check)
+        to_check = set(r.get_prepid() for r in to_check)
         for relval in relvals:
             prepid = relval.get_prepid()
             with self.locker.get_nonblocking_lock(prepid):
@@ -513,7 +541,7 @@ class RelValController(ControllerBase):
                 cmssw_release = relval.get('cmssw_release')
                 relval_db = Database('relvals')
                 # Make sure all datasets are VALID in DBS
-                steps = relval.get('steps')
+                steps = relval.get('steps') if prepid in to_check else []
                 for step in steps:
                     if step.get_step_type() == 'input_file':
                         dataset = step.get('input')['dataset']
@@ -559,9 +587,14 @@ class RelValController(ControllerBase):
                                      batch_name,
                                      newest_timestamp)
                     relval.set('campaign_timestamp', newest_timestamp)
+                    checkpoint = relval.get('submission_checkpoint')
+                    if prepid in to_check:
+                        checkpoint['datasets'] = now
+
+                    relval.set('submission_checkpoint', checkpoint)
                     self.update_status(relval, 'submitting')
 
-                RequestSubmitter().add(relval, self)
+                RequestSubmitter().add(relval, self, priorities.get(prepid))
                 results.append(relval)
 
         return results
@@ -608,6 +641,7 @@ class RelValController(ControllerBase):
         for step in relval.get('steps'):
             step.set('resolved_globaltag', '')
 
+        self.clear_submission_checkpoint(relval)
         self.update_status(relval, 'new')
         return relval
 
@@ -626,10 +660,29 @@ class RelValController(ControllerBase):
         for step in relval.get('steps'):
             step.set('config_id', '')
 
+        relval.set('submission_checkpoint', {})
         relval.set('campaign_timestamp', 0)
         self.update_status(relval, 'approved')
         return relval
 
+    def clear_submission_checkpoint(self, relval):
+        """
+        Forget completed submission stages of RelVal and reject or abort workflow
+        that was left in ReqMgr2 by a failed submission
+        """
+        workflow_name = relval.get('submission_checkpoint').get('workflow_name')
+        if workflow_name:
+            # Workflow might have been assigned since, so it's current status is used
+            status = ReqMgrClient().get_statuses([workflow_name])[workflow_name]
+            if status and status not in ReqMgrClient.inactive_statuses:
+                self.reject_workflows([{'name': workflow_name,
+                                        'status_history': [{'status': status}]}])
+
+        for step in relval.get('steps'):
+            step.set('config_id', '')
+
+        relval.set('submission_checkpoint', {})
+
     def pick_workflows(self, all_workflows, output_datasets):
         """
         Pick, process and sort workflows from computing based on output datasets
@@ -678,26 +731,29 @@ class RelValController(ControllerBase):
                          ', '.join([x['name'] for x in active_workflows]))
         return active_workflows
 
-    def force_stats_to_refresh(self, workflows):
+    def force_stats_to_refresh(self, workflows, timeout=None):
         """
         Force Stats2 to update workflows with given workflow names
+        If timeout is given, update is killed if it runs longer than timeout
         """
         if not workflows:
             return
 
-        credentials_path = Config.get('credentials_path')
+        # Stats2 scripts are only on Stats2 machine, so SSH is used unless configured otherwise
+        stats_backend = Config.get('stats_executor') or 'ssh'
         with self.locker.get_lock('refresh-stats'):
-            ssh_executor = SSHExecutor('vocms074.cern.ch', credentials_path)
             workflow_update_commands = ['cd /home/pdmvserv/private',
                                         'source setup_credentials.sh',
                                         'cd /home/pdmvserv/Stats2']
+            time_limit = f'timeout {timeout} ' if timeout else ''
             for workflow_name in workflows:
                 workflow_update_commands.append(
-                    f'python3 stats_update.py --action update --name {workflow_name}'
+                    f'{time_limit}python3 stats_update.py --action update --name {workflow_name}'
                 )
 
             self.logger.info('Will make Stats2 refresh these workflows: %s', ', '.join(workflows))
-            ssh_executor.execute_command(workflow_update_commands)
+            with ExecutorPool().borrow('vocms074.cern.ch', stats_backend) as executor:
+                executor.execute_command(workflow_update_commands, retry=True)
 
     def reject_workflows(self, workflows):
         """
@@ -706,10 +762,10 @@ class RelValController(ControllerBase):
         cmsweb_url = Config.get('cmsweb_url')
         grid_cert = Config.get('grid_user_cert')
         grid_key = Config.get('grid_user_key')
-        connection = ConnectionWrapper(host=cmsweb_url,
-                                       keep_open=True,
-                                       cert_file=grid_cert,
-                                       key_file=grid_key)
+        connection = RetryingConnectionWrapper(host=cmsweb_url,
+                                               keep_open=True,
+                                               cert_file=grid_cert,
+                                               key_file=grid_key)
         headers = {'Content-type': 'application/json',
                    'Accept': 'application/json'}
         for workflow in workflows:
@@ -753,10 +809,10 @@ class RelValController(ControllerBase):
         relval_db = Database('relvals')
         with self.locker.get_lock(prepid):
             relval = self.get(prepid)
-            stats_conn = ConnectionWrapper(host='vocms074.cern.ch',
-                                           port=5984,
-                                           https=False,
-                                           keep_open=True)
+            stats_conn = RetryingConnectionWrapper(host='vocms074.cern.ch',
+                                                   port=5984,
+                                                   https=False,
+                                                   keep_open=True)
             existing_workflows = relval.get('workflows')
             stats_workflows = stats_conn.api(
                 'GET',
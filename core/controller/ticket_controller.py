@@ -2,16 +2,17 @@
 Module that contains TicketController class
 """
 import json
-import os
-from random import Random
 from core_lib.database.database import Database
 from core_lib.controller.controller_base import ControllerBase
-from core_lib.utils.ssh_executor import SSHExecutor
-from core_lib.utils.common_utils import clean_split, cmssw_setup
+from core_lib.utils.common_utils import clean_split
 from core_lib.utils.global_config import Config
 from core.model.ticket import Ticket
 from core.model.relval_step import RelValStep
 from core.controller.relval_controller import RelValController
+from core.utils.executor_pool import ExecutorPool
+from core.utils.remote_job import RemoteJob
+from core.utils.cmssw_area_cache import CMSSWAreaCache
+from core.utils.voms_proxy import VOMSProxy
 
 
 class TicketController(ControllerBase):
@@ -163,9 +164,7 @@ class TicketController(ControllerBase):
         ticket_db = Database(self.database_name)
         ticket_prepid = ticket.get_prepid()
         ticket_dir = f'ticket_{ticket_prepid}'
-        credentials_path = Config.get('credentials_path')
         remote_directory = Config.get('remote_path').rstrip('/')
-        ssh_executor = SSHExecutor('lxplus.cern.ch', credentials_path)
         relval_controller = RelValController()
         created_relvals = []
         with self.locker.get_lock(ticket_prepid):
@@ -189,40 +188,32 @@ class TicketController(ControllerBase):
             try:
                 workflow_ids = ','.join([str(x) for x in ticket.get('workflow_ids')])
                 self.logger.info('Creating RelVals %s for %s', workflow_ids, ticket_prepid)
-                # Prepare empty directory with runTheMatrixPdmV.py
-                command = [f'rm -rf {remote_directory}/{ticket_dir}',
-                           f'mkdir -p {remote_directory}/{ticket_dir}']
-                _, err, code = ssh_executor.execute_command(command)
-                if code != 0:
-                    raise Exception(f'Error code {code} preparing workspace: {err}')
-
-                ssh_executor.upload_file('core/utils/runTheMatrixPdmV.py',
-                                         f'{remote_directory}/{ticket_dir}/runTheMatrixPdmV.py')
-                # Create a random name for temporary file
-                random = Random()
-                file_name = f'{ticket_prepid}_{int(random.randint(1000, 9999))}.json'
-                # Execute runTheMatrixPdmV.py
-                command = [f'cd {remote_directory}/{ticket_dir}']
-                command.extend(cmssw_setup(cmssw_release, reuse_cmssw=True).split('\n'))
-                command += ['python runTheMatrixPdmV.py '
-                            f'-l={workflow_ids} '
-                            f'-w={matrix} '
-                            f'-o={file_name} '
-                            f'{additional_command} '
-                            f'{recycle_gs_flag}']
-                _, err, code = ssh_executor.execute_command(command)
+                # Workspace with runTheMatrixPdmV.py is sent, script is run and
+                # output file is returned in one round trip
+                file_name = f'{ticket_prepid}.json'
+                job = RemoteJob(f'{remote_directory}/{ticket_dir}')
+                job.add_helper('runTheMatrixPdmV.py', 'core/utils/runTheMatrixPdmV.py')
+                job.add_output(file_name)
+                script = [VOMSProxy().get_export_command()]
+                script.extend(CMSSWAreaCache().get_setup_script(cmssw_release).split('\n'))
+                script += ['python runTheMatrixPdmV.py '
+                           f'-l={workflow_ids} '
+                           f'-w={matrix} '
+                           f'-o={file_name} '
+                           f'{additional_command} '
+                           f'{recycle_gs_flag}']
+                with ExecutorPool().borrow() as executor:
+                    # Execute runTheMatrixPdmV.py with shared proxy
+                    VOMSProxy().ensure(executor)
+                    _, err, code, files = job.run(executor, script, retry=True)
+
                 if code != 0:
                     raise Exception(f'Error code {code} creating RelVals: {err}')
 
-                ssh_executor.download_file(f'{remote_directory}/{ticket_dir}/{file_name}',
-                                           f'/tmp/{file_name}')
-
-                # Cleanup remote directory
-                ssh_executor.execute_command(f'rm -rf {remote_directory}/{ticket_dir}')
-                with open(f'/tmp/{file_name}', 'r') as workflows_file:
-                    workflows = json.load(workflows_file)
+                if file_name not in files:
+                    raise Exception(f'Could not get {file_name} from remote machine')
 
-                os.remove(f'/tmp/{file_name}')
+                workflows = json.loads(files[file_name])
                 # Iterate through workflows and create RelVals
                 for workflow_id, workflow_dict in workflows.items():
                     workflow_json = {'batch_name': batch_name,
@@ -2,10 +2,12 @@
 Module that contains RelVal class
 """
 from copy import deepcopy
-from core.model.model_base import ModelBase
-from core.model.relval_step import RelValStep
 from core_lib.utils.common_utils import cmssw_setup
 from core_lib.utils.global_config import Config
+from core.model.model_base import ModelBase
+from core.model.relval_step import RelValStep
+from core.utils.cmssw_area_cache import CMSSWAreaCache
+from core.utils.wmcore_checkout import WMCoreCheckout
 
 
 class RelVal(ModelBase):
@@ -46,6 +48,9 @@ class RelVal(ModelBase):
         'status': 'new',
         # Steps of RelVal
         'steps': [],
+        # Times when submission stages were completed and submitted workflow name
+        # that allow failed submission to be resumed
+        'submission_checkpoint': {},
         # Time per event in seconds
         'time_per_event': 1.0,
         # Workflow ID
@@ -94,30 +99,122 @@ class RelVal(ModelBase):
 
         ModelBase.__init__(self, json_input, check_attributes)
 
-    def get_cmsdrivers(self, for_submission=False):
+    def get_cmsdrivers(self, for_submission=False, skip_configs=None):
         """
         Get all cmsDriver commands for this RelVal
+        Steps whose config names are in skip_configs are left out
+        Submission uses CMSSW areas from the remote cache and runs cmsDrivers
+        of the same CMSSW release in parallel
         """
+        parallel = int(Config.get('cmsdriver_parallel_limit') or 4) if for_submission else 1
         built_command = ''
+        if parallel > 1:
+            built_command += self.__get_parallel_functions()
+            built_command += '\n\n'
+
         previous_step_cmssw = None
         for step in self.get('steps'):
+            if skip_configs and step.get_config_file_name() in skip_configs:
+                continue
+
             step_cmssw = step.get('cmssw_release')
             if step_cmssw != previous_step_cmssw:
-                built_command += cmssw_setup(step_cmssw, reuse_cmssw=for_submission)
+                if parallel > 1 and previous_step_cmssw is not None:
+                    # Steps of previous release must finish before changing environment
+                    built_command += 'cmsdriver_wait_all\n\n'
+
+                built_command += self.get_cmssw_setup(step, for_submission)
                 built_command += '\n\n'
 
             previous_step_cmssw = step_cmssw
-            built_command += step.get_command(for_submission)
+            command = step.get_command(for_submission)
+            if parallel > 1 and step.get_step_type() != 'input_file':
+                index = step.get_index_in_parent()
+                command = (f'cmsdriver_limit {parallel}\n'
+                           f'(\n{command}\n) > cmsdriver_step{index + 1}.log 2>&1 &\n'
+                           'CMSDRIVER_RUNNING=$((CMSDRIVER_RUNNING + 1))')
+
+            built_command += command
             built_command += '\n\n\n\n'
 
+        if parallel > 1:
+            built_command += 'cmsdriver_wait_all\n'
+
         return built_command.strip()
 
-    def get_config_upload(self):
+    @staticmethod
+    def __get_parallel_functions():
+        """
+        Get bash functions that run cmsDrivers in background, limit number of
+        running cmsDrivers and stop all of them when one fails
+        """
+        functions = ['CMSDRIVER_RUNNING=0',
+                     '# Wait for a cmsDriver to finish, stop others and exit if it failed',
+                     'cmsdriver_wait() {',
+                     '  wait -n',
+                     '  CMSDRIVER_EXIT_CODE=$?',
+                     '  CMSDRIVER_RUNNING=$((CMSDRIVER_RUNNING - 1))',
+                     '  if [ $CMSDRIVER_EXIT_CODE -ne 0 ]; then',
+                     '    for PID in $(jobs -rp); do pkill -P $PID; kill $PID; done 2>/dev/null',
+                     '    wait',
+                     '    cat cmsdriver_step*.log 2>/dev/null',
+                     '    exit $CMSDRIVER_EXIT_CODE',
+                     '  fi',
+                     '}',
+                     '# Wait until less than given number of cmsDrivers are running',
+                     'cmsdriver_limit() {',
+                     '  while [ $CMSDRIVER_RUNNING -ge $1 ]; do',
+                     '    cmsdriver_wait',
+                     '  done',
+                     '}',
+                     '# Wait for all cmsDrivers to finish and print their output',
+                     'cmsdriver_wait_all() {',
+                     '  cmsdriver_limit 1',
+                     '  cat cmsdriver_step*.log 2>/dev/null',
+                     '  rm -f cmsdriver_step*.log',
+                     '}']
+        return '\n'.join(functions)
+
+    def get_upload_releases(self, skip_configs=None):
+        """
+        Return list of tuples of first step of each CMSSW release and config names of
+        steps of that release that need to be uploaded
+        Steps whose config names are in skip_configs are left out
+        """
+        skip_configs = skip_configs or {}
+        release_configs = []
+        for step in self.get('steps'):
+            config_name = step.get_config_file_name()
+            if config_name and config_name not in skip_configs:
+                step_cmssw = step.get('cmssw_release')
+                if not release_configs or release_configs[-1][0].get('cmssw_release') != step_cmssw:
+                    release_configs.append((step, []))
+
+                release_configs[-1][1].append(config_name)
+
+        return release_configs
+
+    @staticmethod
+    def get_release_key(step):
+        """
+        Return key of CMSSW release and scram arch of a step that batch upload
+        groups configs by
+        """
+        return f'{step.get("cmssw_release")}/{step.get("scram_arch") or "auto"}'
+
+    def get_config_upload(self, for_batch=False, skip_configs=None):
         """
         Get config upload commands for this RelVal
+        If script will be part of a batch, it only checks config files and prints
+        release key and config files of each CMSSW release, batch script uploads
+        configs of all RelVals of the same release together
+        Steps whose config names are in skip_configs are left out
         """
+        skip_configs = skip_configs or {}
         built_command = ''
-        built_command += 'python --version\n'
+        if not for_batch:
+            built_command += 'python --version\n'
+
         self.logger.debug('Getting config upload script for %s', self.get_prepid())
         database_url = Config.get('cmsweb_url') + '/couchdb'
         file_check = 'if [ ! -s "%s.py" ]; then\n'
@@ -127,40 +224,53 @@ class RelVal(ModelBase):
         for step in self.get('steps'):
             # Run config check
             config_name = step.get_config_file_name()
-            if config_name:
+            if config_name and config_name not in skip_configs:
                 built_command += file_check % (config_name, config_name)
 
-        # Add path to WMCore
-        # This should be done in a smarter way
-        built_command += 'git clone --quiet https://github.com/dmwm/WMCore.git\n'
-        built_command += 'export PYTHONPATH=$(pwd)/WMCore/src/python/:$PYTHONPATH\n\n'
+        release_configs = self.get_upload_releases(skip_configs)
+        if for_batch:
+            for release_step, config_names in release_configs:
+                config_files = ' '.join(f'{x}.py' for x in config_names)
+                built_command += f'echo "{self.get_release_key(release_step)} {config_files}"\n'
+
+            return built_command.strip()
+
+        # Add path to shared WMCore checkout
+        built_command += WMCoreCheckout().get_setup_script()
+        built_command += '\n'
         file_upload = ('python config_uploader.py --file $(pwd)/%s.py --label %s '
                        f'--group ppd --user $(echo $USER) --db {database_url} || exit $?\n')
-        previous_step_cmssw = None
         cmssw_versions = []
-        for step in self.get('steps'):
-            # Run config check
-            config_name = step.get_config_file_name()
-            if config_name:
-                step_cmssw = step.get('cmssw_release')
-                if step_cmssw != previous_step_cmssw:
-                    built_command += '\n'
-                    built_command += cmssw_setup(step_cmssw)
-                    built_command += '\n\n'
-                    if step_cmssw not in cmssw_versions:
-                        cmssw_versions.append(step_cmssw)
-
-                previous_step_cmssw = step_cmssw
+        for release_step, config_names in release_configs:
+            if release_step.get('cmssw_release') not in cmssw_versions:
+                cmssw_versions.append(release_step.get('cmssw_release'))
+
+            built_command += '\n'
+            built_command += self.get_cmssw_setup(release_step)
+            built_command += '\n\n'
+            for config_name in config_names:
                 built_command += file_upload % (config_name, config_name)
 
-        # Remove WMCore in order not to run out of space
+        # Remove CMSSW in order not to run out of space
         built_command += '\n'
-        built_command += 'rm -rf WMCore\n'
         for cmssw_version in cmssw_versions:
             built_command += f'rm -rf {cmssw_version}\n'
 
         return built_command.strip()
 
+    @staticmethod
+    def get_cmssw_setup(step, use_cache=False):
+        """
+        Get CMSSW environment setup commands for step's CMSSW release
+        If cache is used, CMSSW area is taken from the remote cache instead of
+        being created in current directory
+        """
+        cmssw_release = step.get('cmssw_release')
+        if use_cache:
+            return CMSSWAreaCache().get_setup_script(cmssw_release, step.get('scram_arch'))
+
+        return cmssw_setup(cmssw_release)
+
     def get_relval_string_suffix(self):
         """
         A string based on step contents:
@@ -0,0 +1,174 @@
+"""
+Script that uploads multiple cmsDriver config files to ReqMgr2 ConfigCache in one process
+Configs are loaded one by one and uploaded concurrently by worker threads
+that keep one connection to CouchDB for all of their uploads
+Configs of different RelVals might have the same file name, so they are told
+apart by their paths in the output
+"""
+from __future__ import print_function
+import os
+import sys
+import copy
+import argparse
+import threading
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+try:
+    from importlib.util import spec_from_file_location, module_from_spec
+except ImportError:
+    import imp
+    spec_from_file_location = None
+from PSetTweaks.WMTweak import makeTweak
+from WMCore.Cache.WMConfigCache import ConfigCache
+
+
+DATABASE_NAME = 'reqmgr_config_cache'
+
+
+class BatchConfigCache(ConfigCache):
+    """
+    ConfigCache that can start a new document, so one CouchDB connection is
+    used for many uploads
+    """
+
+    def __init__(self, *args, **kwargs):
+        ConfigCache.__init__(self, *args, **kwargs)
+        # Each upload starts with a copy of the empty document made by constructor
+        self.empty_document = copy.deepcopy(self.document)
+        self.empty_attachments = copy.deepcopy(self.attachments)
+
+    def new_document(self):
+        """
+        Replace current document with a new empty one
+        """
+        self.document = copy.deepcopy(self.empty_document)
+        self.attachments = copy.deepcopy(self.empty_attachments)
+
+
+def import_file(file_name, module_name):
+    """
+    Import a python file as a module with given name
+    """
+    if spec_from_file_location is None:
+        return imp.load_source(module_name, file_name)
+
+    spec = spec_from_file_location(module_name, file_name)
+    module = module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_tweaks(file_name, index):
+    """
+    Import a config file and return it's PSet tweaks
+    Each file is imported under a unique name, because files of different RelVals
+    have the same names
+    """
+    directory = os.path.dirname(os.path.abspath(file_name))
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+
+    module = import_file(file_name, 'batch_config_%s' % (index))
+    return makeTweak(module.process).jsondictionary()
+
+
+def get_label(file_name):
+    """
+    Return label of a config file - file name without extension
+    """
+    label = os.path.basename(file_name)
+    return label[:-3] if label.endswith('.py') else label
+
+
+def upload(config_cache, file_name, label, tweaks, group, user):
+    """
+    Upload a config file using given ConfigCache and return document id
+    """
+    config_cache.createUserGroup(group, user)
+    config_cache.addConfig(file_name)
+    config_cache.setPSetTweaks(tweaks)
+    config_cache.setLabel(label)
+    config_cache.setDescription(label)
+    config_cache.save()
+    return config_cache.document['_id']
+
+
+def upload_worker(jobs, results, args):
+    """
+    Upload configs from jobs queue until it is empty
+    Each worker keeps one connection to CouchDB for all of it's uploads
+    """
+    config_cache = None
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+
+        file_name, label, tweaks = job
+        try:
+            if config_cache is None:
+                config_cache = BatchConfigCache(args.db, DATABASE_NAME)
+            else:
+                config_cache.new_document()
+
+            results[file_name] = upload(config_cache,
+                                        file_name,
+                                        label,
+                                        tweaks,
+                                        args.group,
+                                        args.user)
+        except Exception as ex:
+            results[file_name] = ex
+
+
+def main():
+    """
+    Main
+    """
+    parser = argparse.ArgumentParser(description='Upload config files to ReqMgr2 ConfigCache')
+    parser.add_argument('--db', required=True, help='CouchDB URL')
+    parser.add_argument('--group', default='ppd', help='Group name')
+    parser.add_argument('--user', required=True, help='User name')
+    parser.add_argument('--threads', type=int, default=4, help='Number of concurrent uploads')
+    parser.add_argument('files', nargs='+', help='Config files')
+    args = parser.parse_args()
+
+    # Load configs before uploading, imports are not thread safe
+    jobs = Queue()
+    for file_name in args.files:
+        if not os.path.isfile(file_name):
+            print('File %s is missing' % (file_name), file=sys.stderr)
+            sys.exit(1)
+
+    for index, file_name in enumerate(args.files):
+        jobs.put((file_name, get_label(file_name), load_tweaks(file_name, index)))
+
+    results = {}
+    threads_count = max(1, min(args.threads, len(args.files)))
+    workers = []
+    for _ in range(threads_count):
+        jobs.put(None)
+        worker = threading.Thread(target=upload_worker, args=(jobs, results, args))
+        worker.start()
+        workers.append(worker)
+
+    for worker in workers:
+        worker.join()
+
+    failed = False
+    for file_name in args.files:
+        result = results.get(file_name)
+        if isinstance(result, Exception) or result is None:
+            print('Error uploading %s: %s' % (file_name, result), file=sys.stderr)
+            failed = True
+        else:
+            print('DocID: %s %s %s' % (get_label(file_name), result, file_name))
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
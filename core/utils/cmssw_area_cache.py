@@ -0,0 +1,120 @@
+"""
+Module that contains CMSSWAreaCache class
+"""
+import time
+import logging
+from threading import Thread, Lock
+from core_lib.utils.common_utils import get_scram_arch
+from core_lib.utils.global_config import Config
+from core.utils.executor_pool import ExecutorPool
+
+
+class CMSSWAreaCache():
+    """
+    Cache of CMSSW project areas in the remote area
+    There is one area per CMSSW release and scram arch and each area has a lock file
+    Scripts that use an area hold a shared lock on it until they finish, so lock
+    holders are references to the area and lock file modification time is it's last use
+    Missing area is created under a separate creation lock
+    Least recently used areas that are not in use are removed
+    """
+
+    __cleanup_thread = None
+    __cleanup_lock = Lock()
+
+    def __init__(self):
+        self.logger = logging.getLogger()
+        remote_directory = Config.get('remote_path').rstrip('/')
+        self.directory = f'$HOME/{remote_directory}/cmssw'
+
+    def get_setup_script(self, cmssw_release, scram_arch=None):
+        """
+        Return bash script that creates CMSSW area in the cache if it does not exist,
+        takes a reference to it and sets up CMSSW environment
+        Each line is a complete command
+        """
+        if not scram_arch:
+            scram_arch = get_scram_arch(cmssw_release)
+
+        if not scram_arch:
+            raise Exception(f'Could not find scram arch for {cmssw_release}')
+
+        areas = f'{self.directory}/{scram_arch}'
+        area = f'{areas}/{cmssw_release}'
+        commands = [f'export SCRAM_ARCH={scram_arch}',
+                    'source /cvmfs/cms.cern.ch/cmsset_default.sh',
+                    'ORG_PWD=$(pwd)',
+                    f'mkdir -p {areas}',
+                    # Shared lock is held until script exits, so area is not removed
+                    f'exec {{CMSSW_LOCK}}>{area}.lock',
+                    'flock -s $CMSSW_LOCK',
+                    # Area is created under a separate lock that is released right after,
+                    # so shared lock is never upgraded and users of the area do not wait
+                    f'if [ ! -r {area}/src ]; then '
+                    f'exec {{CMSSW_CREATE_LOCK}}>{area}.create.lock; '
+                    'flock -x $CMSSW_CREATE_LOCK; '
+                    f'if [ ! -r {area}/src ]; then rm -rf {area}; '
+                    f'(cd {areas} && scram project CMSSW {cmssw_release}) || exit $?; fi; '
+                    'exec {CMSSW_CREATE_LOCK}>&-; fi',
+                    f'touch {area}.lock',
+                    f'cd {area}/src',
+                    'eval `scram runtime -sh`',
+                    'cd $ORG_PWD']
+        return '\n'.join(commands)
+
+    def cleanup(self):
+        """
+        Remove least recently used areas that are not in use and exceed cache size
+        """
+        cache_size = int(Config.get('cmssw_area_cache_size') or 20)
+        command = [f'mkdir -p {self.directory}',
+                   f'ls -t {self.directory}/*/*.lock 2>/dev/null | '
+                   'while read LOCK; do if [ -d ${LOCK%.lock} ]; then echo $LOCK; fi; done | '
+                   f'tail -n +{cache_size + 1} | '
+                   'while read LOCK; do '
+                   'flock -xn $LOCK -c "rm -rf ${LOCK%.lock}" && echo "Removed ${LOCK%.lock}"; '
+                   'done']
+        # Each host might have it's own home directory
+        executor_pool = ExecutorPool()
+        errors = []
+        for host in executor_pool.get_hosts():
+            with executor_pool.borrow(host) as executor:
+                stdout, stderr, exit_code = executor.execute_command(command, retry=True)
+
+            if exit_code != 0:
+                errors.append(f'{host}: {stderr}')
+                continue
+
+            for line in stdout.split('\n'):
+                if line.strip():
+                    self.logger.info('%s: %s', host, line.strip())
+
+        if errors:
+            errors = '\n'.join(errors)
+            raise Exception(f'Error cleaning up CMSSW areas: {errors}')
+
+    def start_cleanup(self):
+        """
+        Start a background thread that periodically cleans up the cache
+        """
+        with CMSSWAreaCache.__cleanup_lock:
+            if CMSSWAreaCache.__cleanup_thread is not None:
+                return
+
+            interval = int(Config.get('cmssw_area_cleanup_interval') or 3600)
+            thread = Thread(target=self.__cleanup_loop, args=(interval, ), name='cmssw-cleanup')
+            thread.daemon = True
+            thread.start()
+            CMSSWAreaCache.__cleanup_thread = thread
+
+    def __cleanup_loop(self, interval):
+        """
+        Clean up the cache and wait for the given interval
+        """
+        while True:
+            try:
+                self.cleanup()
+            except Exception as ex:
+                self.logger.error('Error cleaning up CMSSW areas: %s', ex)
+
+            time.sleep(interval)
@@ -0,0 +1,101 @@
+"""
+Module that contains ConfigCache class
+"""
+import time
+import hashlib
+import logging
+from threading import Lock
+from core_lib.database.database import Database
+from core_lib.utils.global_config import Config
+
+
+class ConfigCache():
+    """
+    Cache of config ids of configs that were uploaded to ReqMgr2 ConfigCache
+    Configs are identified by a hash of fully rendered step command, CMSSW release,
+    scram arch and resolved globaltag, so identical steps of different RelVals
+    can reuse the same config
+    """
+
+    # Campaign to number of cache hits and misses
+    __stats = {}
+    __stats_lock = Lock()
+
+    def __init__(self):
+        self.logger = logging.getLogger()
+        self.database = Database('config_cache')
+
+    @staticmethod
+    def get_key(step):
+        """
+        Return cache key of a step
+        """
+        parts = [Config.get('cmsweb_url'),
+                 step.get('cmssw_release'),
+                 step.get('scram_arch'),
+                 step.get('resolved_globaltag'),
+                 step.get_command(for_submission=True)]
+        return hashlib.sha256('\n'.join(parts).encode('utf-8')).hexdigest()
+
+    def get_cached_configs(self, relval):
+        """
+        Return a dictionary of config names and config ids of RelVal's steps that are in cache
+        """
+        cached_configs = {}
+        for step in relval.get('steps'):
+            config_name = step.get_config_file_name()
+            if not config_name:
+                continue
+
+            cached = self.database.get(self.get_key(step))
+            if cached:
+                cached_configs[config_name] = cached['config_id']
+
+        return cached_configs
+
+    def save_configs(self, relval, cached_configs):
+        """
+        Save config ids of RelVal's steps that were not taken from the cache
+        """
+        for step in relval.get('steps'):
+            config_name = step.get_config_file_name()
+            if not config_name or config_name in cached_configs:
+                continue
+
+            config_id = step.get('config_id')
+            if not config_id:
+                continue
+
+            self.database.save({'_id': self.get_key(step),
+                                'config_id': config_id,
+                                'cmssw_release': step.get('cmssw_release'),
+                                'created': int(time.time())})
+
+    def record(self, campaign, hits, misses):
+        """
+        Add number of cache hits and misses to campaign's statistics
+        """
+        with ConfigCache.__stats_lock:
+            stats = ConfigCache.__stats.setdefault(campaign, {'hits': 0, 'misses': 0})
+            stats['hits'] += hits
+            stats['misses'] += misses
+            total = stats['hits'] + stats['misses']
+            self.logger.info('Config cache hit ratio of %s is %s/%s',
+                             campaign,
+                             stats['hits'],
+                             total)
+
+    def get_stats(self):
+        """
+        Return number of cache hits, misses and hit ratio of each campaign
+        """
+        with ConfigCache.__stats_lock:
+            stats = {}
+            for campaign, campaign_stats in ConfigCache.__stats.items():
+                total = campaign_stats['hits'] + campaign_stats['misses']
+                ratio = campaign_stats['hits'] / total if total else 0.0
+                stats[campaign] = {'hits': campaign_stats['hits'],
+                                   'misses': campaign_stats['misses'],
+                                   'ratio': round(ratio, 4)}
+
+            return stats
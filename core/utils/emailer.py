@@ -1,6 +1,7 @@
 """
 Module that handles all email notifications
 """
+from email.mime.text import MIMEText
 from core_lib.utils.emailer import Emailer as BaseEmailer
 from core_lib.utils.global_config import Config
 
@@ -10,11 +11,24 @@ class Emailer(BaseEmailer):
     Emailer sends email notifications to users
     """
 
-    def send(self, subject, body, recipients):
+    def send(self, subject, body, recipients, smtp=None):
+        """
+        Send email with instance prefix and signature
+        If SMTP connection is given, email is sent over it instead of a new connection
+        """
         body = body.strip()  + '\n\nSincerely,\nRelVal Machine'
         if Config.get('development'):
             subject = f'[RelVal-DEV] {subject}'
         else:
             subject = f'[RelVal] {subject}'
 
-        super().send(subject, body, recipients)
+        if smtp is None:
+            super().send(subject, body, recipients)
+            return
+
+        sender = Config.get('email_sender') or 'PdmV Service Account <pdmvserv@cern.ch>'
+        message = MIMEText(body)
+        message['Subject'] = subject
+        message['From'] = sender
+        message['To'] = ', '.join(recipients)
+        smtp.sendmail(sender, recipients, message.as_string())
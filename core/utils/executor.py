@@ -0,0 +1,196 @@
+"""
+Module that contains executors that run commands on the remote machine or locally
+"""
+import os
+import time
+import select
+import subprocess
+from abc import ABC, abstractmethod
+from core_lib.utils.ssh_executor import SSHExecutor
+from core.utils.retry_policy import RetryPolicy
+
+
+class Executor(ABC):
+    """
+    Interface of command executors
+    Commands are run with user's home directory as working directory, so relative
+    and $HOME paths point to the same place in all executors
+    Executors set "failed" attribute when the host itself fails, e.g. connection
+    breaks, failures of commands do not count
+    """
+
+    failed = False
+
+    @staticmethod
+    def join_command(command):
+        """
+        Return command as a string, list of commands are joined into one
+        """
+        if isinstance(command, list):
+            return '; '.join(command)
+
+        return command
+
+    @abstractmethod
+    def execute_command(self, command, retry=False):
+        """
+        Run a command or a list of commands
+        Command is repeated after transient errors only if retry is set, so only
+        commands that can be safely repeated should set it
+        Return standard output, standard error and exit code
+        """
+
+    @abstractmethod
+    def run(self, command, input_data=b'', timeout=None, retry=False):
+        """
+        Run a command and send input data to it's standard input
+        Raise an exception if command does not finish within timeout seconds
+        Command is repeated after transient errors only if retry is set
+        Return standard output, standard error and exit code
+        """
+
+    def is_alive(self):
+        """
+        Return whether executor can be reused
+        """
+        return True
+
+    def close_connections(self):
+        """
+        Release resources of the executor
+        """
+
+
+class SSHBackend(Executor):
+    """
+    Executor that runs commands on a remote machine over SSH
+    Commands that can be safely repeated are retried over a new connection if
+    they fail because of transient connection errors
+    """
+
+    def __init__(self, host, credentials_path):
+        self.host = host
+        self.ssh_executor = SSHExecutor(host, credentials_path)
+
+    def __reconnect(self):
+        """
+        Close broken connection, so it is opened again when it is used
+        """
+        try:
+            self.ssh_executor.close_connections()
+        except Exception:
+            pass
+
+        self.ssh_executor.ssh_client = None
+
+    def __call(self, retry, function, *args):
+        """
+        Call a function that uses the connection, if retry is set, call it again
+        over a new connection when it fails with a transient error
+        Mark executor as failed if function fails
+        """
+        try:
+            if retry:
+                policy = RetryPolicy(f'SSH {self.host}')
+                return policy.call(function, *args, on_retry=self.__reconnect)
+
+            return function(*args)
+        except Exception:
+            self.failed = True
+            raise
+
+    def execute_command(self, command, retry=False):
+        return self.__call(retry, self.ssh_executor.execute_command, command)
+
+    def run(self, command, input_data=b'', timeout=None, retry=False):
+        """
+        Run a command over SSH connection, send input data to it's standard input
+        and return standard output, standard error and exit code
+        Both outputs are read at the same time, so neither of them can fill up
+        Connection is given up if command does not finish within timeout seconds,
+        so a hanging connection can not block the caller forever
+        """
+        return self.__call(retry, self.__run, command, input_data, timeout)
+
+    def __run(self, command, input_data, timeout):
+        """
+        Run a command over SSH connection
+        """
+        deadline = time.time() + timeout if timeout else None
+        if not self.ssh_executor.ssh_client:
+            self.ssh_executor.setup_ssh()
+
+        channel = self.ssh_executor.ssh_client.get_transport().open_session()
+        stdout = []
+        stderr = []
+        try:
+            channel.exec_command(self.join_command(command))
+            if input_data:
+                channel.sendall(input_data)
+
+            channel.shutdown_write()
+            while True:
+                if channel.recv_ready():
+                    stdout.append(channel.recv(65536))
+                elif channel.recv_stderr_ready():
+                    stderr.append(channel.recv_stderr(65536))
+                elif channel.exit_status_ready() and channel.eof_received:
+                    break
+                elif deadline and time.time() > deadline:
+                    raise Exception(f'Command on {self.host} did not finish in {timeout}s')
+                else:
+                    select.select([channel], [], [], 1)
+
+            exit_code = channel.recv_exit_status()
+        finally:
+            channel.close()
+
+        stdout = b''.join(stdout).decode('utf-8', errors='replace')
+        stderr = b''.join(stderr).decode('utf-8', errors='replace')
+        return stdout, stderr, exit_code
+
+    def is_alive(self):
+        """
+        Return whether connection can be reused
+        Executor that did not connect yet will connect when it is used
+        """
+        ssh_client = getattr(self.ssh_executor, 'ssh_client', None)
+        if not ssh_client:
+            return True
+
+        transport = ssh_client.get_transport()
+        return transport is not None and transport.is_active()
+
+    def close_connections(self):
+        self.ssh_executor.close_connections()
+
+
+class LocalBackend(Executor):
+    """
+    Executor that runs commands in a subprocess on this machine
+    It can be used on machines that have CVMFS mounted or to run submission
+    without a remote machine
+    """
+
+    def __init__(self):
+        self.host = 'localhost'
+        self.home = os.path.expanduser('~')
+
+    def execute_command(self, command, retry=False):
+        return self.run(command)
+
+    def run(self, command, input_data=b'', timeout=None, retry=False):
+        try:
+            process = subprocess.run(['bash', '-c', self.join_command(command)],
+                                     input=input_data,
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.PIPE,
+                                     cwd=self.home,
+                                     timeout=timeout,
+                                     check=False)
+        except subprocess.TimeoutExpired as ex:
+            raise Exception(f'Command on {self.host} did not finish in {timeout}s') from ex
+
+        stdout = process.stdout.decode('utf-8', errors='replace')
+        stderr = process.stderr.decode('utf-8', errors='replace')
+        return stdout, stderr, process.returncode
@@ -0,0 +1,77 @@
+"""
+Module that contains ExecutorPool class
+"""
+from contextlib import contextmanager
+from threading import Lock, BoundedSemaphore
+from core_lib.utils.global_config import Config
+from core.utils.ssh_pool import SSHPool
+from core.utils.executor import LocalBackend
+from core.utils.host_balancer import HostBalancer
+
+
+class ExecutorPool():
+    """
+    Entry point for running commands, backend is selected by "executor" in config
+    "ssh" runs commands on remote hosts over pooled SSH connections and
+    "local" runs them in subprocesses on this machine
+    Submission can use a different backend, "submission_executor" in config, so config
+    generation and upload can run locally, e.g. in tests, while other commands use SSH
+    If host is not given, one of configured remote hosts is picked by HostBalancer
+    """
+
+    # Semaphore that limits number of local processes
+    __local_semaphore = None
+    __lock = Lock()
+
+    @staticmethod
+    def get_backend():
+        """
+        Return name of configured backend
+        """
+        return Config.get('executor') or 'ssh'
+
+    def get_hosts(self):
+        """
+        Return list of hosts that commands can run on
+        """
+        if self.get_backend() == 'local':
+            return ['localhost']
+
+        return [host for host, _ in HostBalancer.get_hosts()]
+
+    def __get_local_semaphore(self):
+        """
+        Return semaphore of local processes, create it if it does not exist
+        """
+        with ExecutorPool.__lock:
+            semaphore = ExecutorPool.__local_semaphore
+            if semaphore is None:
+                max_processes = int(Config.get('local_max_processes') or 4)
+                semaphore = BoundedSemaphore(max_processes)
+                ExecutorPool.__local_semaphore = semaphore
+
+            return semaphore
+
+    @contextmanager
+    def borrow(self, host=None, backend=None):
+        """
+        Borrow an executor for the duration of with block
+        Backend can be forced for commands that must run on the given host
+        """
+        backend = backend or self.get_backend()
+        if backend == 'ssh':
+            credentials_path = Config.get('credentials_path')
+            balancer = HostBalancer()
+            host = balancer.acquire(host)
+            executor = None
+            try:
+                with SSHPool().borrow(host, credentials_path) as executor:
+                    executor.failed = False
+                    yield executor
+            finally:
+                balancer.release(host, executor is None or executor.failed)
+        elif backend == 'local':
+            with self.__get_local_semaphore():
+                yield LocalBackend()
+        else:
+            raise Exception(f'Unknown executor backend "{backend}"')
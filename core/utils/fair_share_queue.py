@@ -0,0 +1,93 @@
+"""
+Module that contains FairShareQueue class
+"""
+from queue import Queue
+
+
+class FairShareQueue(Queue):
+    """
+    Queue that hands out entries with higher priority first and takes turns between
+    users and then between campaigns of a user within the same priority
+    Entries of the same user and campaign are handed out in the order they were added
+    Key function returns tuple of priority, user and campaign of an entry
+    """
+
+    def __init__(self, maxsize=0, key=None):
+        self.key = key or (lambda entry: (0, '', ''))
+        # User and tuple of user and campaign to the number of the turn they were last served
+        # Only users and campaigns that have queued entries are kept
+        self.served = {}
+        super().__init__(maxsize)
+
+    def _init(self, maxsize):
+        self.queue = []
+
+    def _qsize(self):
+        return len(self.queue)
+
+    def _put(self, item):
+        self.queue.append(item)
+
+    def _get(self):
+        keys = [self.key(entry) for entry in self.queue]
+        index = self.__pick(keys, self.served)
+        keys.pop(index)
+        self.__trim(self.served, keys)
+        return self.queue.pop(index)
+
+    @staticmethod
+    def __trim(served, keys):
+        """
+        Remove users and campaigns that have no keys from served turns
+        Turn numbers are relative, so the order of the rest does not change
+        """
+        queued = set()
+        for key in keys:
+            queued.add(key[1])
+            queued.add(key[1:])
+
+        for served_key in [x for x in served if x not in queued]:
+            served.pop(served_key)
+
+    @staticmethod
+    def __pick(keys, served):
+        """
+        Return index of the key that gets the next turn and mark it's user and
+        campaign as served
+        Users and campaigns that were never served or were served longest ago go first
+        """
+        index = min(range(len(keys)),
+                    key=lambda i: (-keys[i][0],
+                                   served.get(keys[i][1], 0),
+                                   served.get(keys[i][1:], 0),
+                                   i))
+        turn = max(served.values(), default=0) + 1
+        served[keys[index][1]] = turn
+        served[keys[index][1:]] = turn
+        return index
+
+    @classmethod
+    def order(cls, entries, key, served=None):
+        """
+        Return list of entries in the order they would be handed out
+        """
+        entries = list(entries)
+        keys = [key(entry) for entry in entries]
+        served = dict(served or {})
+        ordered = []
+        while entries:
+            index = cls.__pick(keys, served)
+            keys.pop(index)
+            ordered.append(entries.pop(index))
+
+        return ordered
+
+    def get_order(self):
+        """
+        Return list of queued entries in the order they will be handed out
+        """
+        with self.mutex:
+            entries = list(self.queue)
+            served = dict(self.served)
+
+        return self.order(entries, self.key, served)
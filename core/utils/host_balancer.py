@@ -0,0 +1,179 @@
+"""
+Module that contains HostBalancer class
+"""
+import time
+import logging
+from collections import deque
+from threading import Condition
+from core_lib.utils.global_config import Config
+from core_lib.utils.common_utils import clean_split
+
+
+class HostBalancer():
+    """
+    Process-wide dispatcher of jobs to remote execution hosts
+    Hosts are given in "remote_hosts" as comma separated list of host or host:cap,
+    they are picked either by least load or round-robin
+    Hosts that fail a number of times in a row are taken out of rotation for a while
+    """
+
+    # Host to dictionary of in-use count, consecutive failures and time until it is down
+    __hosts = {}
+    # Index of next host in round-robin dispatch
+    __next_index = 0
+    # Tuples of time and whether job failed of recent jobs on all hosts
+    __results = deque(maxlen=1000)
+    __condition = Condition()
+
+    def __init__(self):
+        self.logger = logging.getLogger()
+
+    @staticmethod
+    def get_hosts():
+        """
+        Return list of tuples of configured hosts and their concurrency caps
+        """
+        default_cap = int(Config.get('ssh_max_sessions_per_host') or 5)
+        hosts = []
+        for entry in clean_split(Config.get('remote_hosts') or 'lxplus.cern.ch', ','):
+            if ':' in entry:
+                host, cap = entry.split(':', 1)
+                hosts.append((host.strip(), int(cap)))
+            else:
+                hosts.append((entry, default_cap))
+
+        return hosts
+
+    def get_cap(self, host):
+        """
+        Return concurrency cap of a host
+        """
+        for configured_host, cap in self.get_hosts():
+            if configured_host == host:
+                return cap
+
+        return int(Config.get('ssh_max_sessions_per_host') or 5)
+
+    @staticmethod
+    def __get_state(host):
+        """
+        Return state of a host, create it if it does not exist
+        Must be called with condition held
+        """
+        if host not in HostBalancer.__hosts:
+            HostBalancer.__hosts[host] = {'in_use': 0, 'failures': 0, 'down_until': 0}
+
+        return HostBalancer.__hosts[host]
+
+    def __pick(self, hosts, check_health):
+        """
+        Return a healthy host that is not at it's cap or None if there is no such host
+        Must be called with condition held
+        """
+        now = time.time()
+        available = []
+        for host, cap in hosts:
+            state = self.__get_state(host)
+            healthy = not check_health or state['down_until'] <= now
+            if healthy and state['in_use'] < cap:
+                available.append((host, cap))
+
+        if not available:
+            return None
+
+        strategy = Config.get('remote_host_dispatch') or 'least_loaded'
+        # Start after the previously picked host, so ties are spread evenly
+        offset = HostBalancer.__next_index % len(available)
+        available = available[offset:] + available[:offset]
+        if strategy == 'round_robin':
+            host = available[0][0]
+        else:
+            host = min(available, key=lambda x: self.__get_state(x[0])['in_use'] / x[1])[0]
+
+        HostBalancer.__next_index += 1
+        return host
+
+    def acquire(self, host=None):
+        """
+        Reserve a slot on the given host or on a picked host and return the host
+        Block if all healthy hosts are at their caps
+        If all hosts are down, host that will be back first is used
+        Given host is used even if it is down, because the job needs that host
+        """
+        hosts = self.get_hosts()
+        if host:
+            hosts = [(host, self.get_cap(host))]
+
+        with HostBalancer.__condition:
+            while True:
+                picked = self.__pick(hosts, check_health=not host)
+                if picked:
+                    break
+
+                now = time.time()
+                states = {h: self.__get_state(h) for h, _ in hosts}
+                if not host and all(s['down_until'] > now for s in states.values()):
+                    picked = min(states, key=lambda h: states[h]['down_until'])
+                    self.logger.warning('All remote hosts are down, using %s', picked)
+                    break
+
+                HostBalancer.__condition.wait(1)
+
+            self.__get_state(picked)['in_use'] += 1
+            return picked
+
+    def release(self, host, failed):
+        """
+        Release a slot on a host and record whether it failed
+        """
+        with HostBalancer.__condition:
+            HostBalancer.__results.append((time.time(), failed))
+            state = self.__get_state(host)
+            state['in_use'] -= 1
+            if failed:
+                state['failures'] += 1
+                max_failures = int(Config.get('remote_host_max_failures') or 3)
+                if state['failures'] >= max_failures:
+                    cooldown = int(Config.get('remote_host_cooldown') or 300)
+                    state['down_until'] = time.time() + cooldown
+                    self.logger.warning('%s failed %s times in a row, taking it out of '
+                                        'rotation for %ss',
+                                        host,
+                                        state['failures'],
+                                        cooldown)
+            else:
+                state['failures'] = 0
+                state['down_until'] = 0
+
+            HostBalancer.__condition.notify_all()
+
+    def get_error_rate(self, window):
+        """
+        Return fraction of jobs that failed on all hosts in the last given number of
+        seconds or None if there were no jobs
+        """
+        since = time.time() - window
+        with HostBalancer.__condition:
+            results = [failed for finished, failed in HostBalancer.__results if finished >= since]
+
+        if not results:
+            return None
+
+        return len([x for x in results if x]) / len(results)
+
+    def get_status(self):
+        """
+        Return usage and health of each configured host
+        """
+        now = time.time()
+        status = {}
+        with HostBalancer.__condition:
+            for host, cap in self.get_hosts():
+                state = self.__get_state(host)
+                status[host] = {'in_use': state['in_use'],
+                                'cap': cap,
+                                'failures': state['failures'],
+                                'healthy': state['down_until'] <= now,
+                                'down_for': max(0, int(state['down_until'] - now))}
+
+        return status
@@ -0,0 +1,153 @@
+"""
+Module that contains Notifier class
+"""
+import time
+import smtplib
+import logging
+from threading import Thread, Lock, Event
+from core_lib.utils.global_config import Config
+from core.utils.emailer import Emailer
+
+
+class Notifier():
+    """
+    Process-wide background queue of email notifications
+    Notifications of the same campaign to the same recipients that are added within
+    notification window are sent as one digest email
+    All notifications that are due at the same time are sent over one SMTP connection
+    """
+
+    # Tuple of campaign and recipients to list of (time, subject, body)
+    __pending = {}
+    __pending_lock = Lock()
+    __wake_up = Event()
+    __thread = None
+    __smtp = None
+
+    def __init__(self):
+        self.logger = logging.getLogger()
+
+    def notify(self, campaign, subject, body, recipients):
+        """
+        Add a notification to the queue, it will be sent in the background
+        """
+        if not recipients:
+            return
+
+        key = (campaign, tuple(sorted(set(recipients))))
+        with Notifier.__pending_lock:
+            Notifier.__pending.setdefault(key, []).append((time.time(), subject, body))
+            if Notifier.__thread is None:
+                thread = Thread(target=self.__work, name='notifier')
+                thread.daemon = True
+                thread.start()
+                Notifier.__thread = thread
+
+        Notifier.__wake_up.set()
+
+    def get_status(self):
+        """
+        Return number of pending notifications of each campaign
+        """
+        with Notifier.__pending_lock:
+            status = {}
+            for (campaign, _), messages in Notifier.__pending.items():
+                status[campaign] = status.get(campaign, 0) + len(messages)
+
+            return status
+
+    def __take_due(self, window):
+        """
+        Take groups of notifications whose oldest notification is older than the window
+        Return taken groups and number of seconds until next group is due
+        """
+        now = time.time()
+        due = []
+        next_due = None
+        with Notifier.__pending_lock:
+            for key, messages in list(Notifier.__pending.items()):
+                wait = messages[0][0] + window - now
+                if wait <= 0:
+                    due.append((key, Notifier.__pending.pop(key)))
+                elif next_due is None or wait < next_due:
+                    next_due = wait
+
+        return due, next_due
+
+    def __work(self):
+        """
+        Main loop of notifier thread
+        """
+        while True:
+            window = int(Config.get('notification_window') or 60)
+            due, next_due = self.__take_due(window)
+            if due:
+                self.__flush(due)
+
+            Notifier.__wake_up.wait(next_due)
+            Notifier.__wake_up.clear()
+
+    def __flush(self, due):
+        """
+        Send all due groups of notifications over one SMTP connection
+        """
+        try:
+            for (campaign, recipients), messages in due:
+                try:
+                    self.__send(campaign, list(recipients), messages)
+                except Exception as ex:
+                    self.logger.error('Error sending %s notifications of %s to %s: %s',
+                                      len(messages),
+                                      campaign,
+                                      ', '.join(recipients),
+                                      ex)
+        finally:
+            self.__close_smtp()
+
+    def __send(self, campaign, recipients, messages):
+        """
+        Send one email or a digest of multiple emails
+        """
+        if len(messages) == 1:
+            _, subject, body = messages[0]
+        else:
+            subject = f'{len(messages)} notifications about {campaign}'
+            body = f'Hello,\n\nThere were {len(messages)} notifications about {campaign}.\n'
+            for _, message_subject, message_body in messages:
+                message_body = message_body.replace('Hello,\n\n', '', 1).strip()
+                body += f'\n\n{message_subject}\n{"-" * len(message_subject)}\n{message_body}'
+
+        self.logger.info('Sending "%s" to %s', subject, ', '.join(recipients))
+        emailer = Emailer()
+        try:
+            emailer.send(subject, body, recipients, self.__get_smtp())
+        except smtplib.SMTPServerDisconnected as ex:
+            # Connection was closed by server, retry once with a new one
+            self.logger.warning('SMTP connection was closed, reconnecting: %s', ex)
+            self.__close_smtp()
+            emailer.send(subject, body, recipients, self.__get_smtp())
+
+    def __get_smtp(self):
+        """
+        Return SMTP connection of current flush, create it if it does not exist
+        """
+        if Notifier.__smtp is None:
+            host = Config.get('smtp_host') or 'localhost'
+            Notifier.__smtp = smtplib.SMTP(host, timeout=30)
+
+        return Notifier.__smtp
+
+    def __close_smtp(self):
+        """
+        Close SMTP connection of current flush if it exists
+        """
+        if Notifier.__smtp is None:
+            return
+
+        try:
+            Notifier.__smtp.quit()
+        except Exception:
+            # Connection might be already closed by server
+            pass
+
+        Notifier.__smtp = None
@@ -0,0 +1,139 @@
+"""
+Module that contains RateLimiter class
+"""
+import time
+import logging
+from collections import deque
+from contextlib import contextmanager
+from threading import Condition
+from core_lib.utils.global_config import Config
+from core_lib.utils.common_utils import clean_split
+
+
+class RateLimiter():
+    """
+    Process-wide limiter of requests to upstream services
+    Each host has a token bucket that limits requests per second and a limit
+    of requests in flight, limits are given in "rate_limits" as comma separated
+    list of host:requests_per_second:max_in_flight
+    Time that requests wait for the limiter is recorded
+    """
+
+    # Host to dictionary of bucket state and wait statistics
+    __buckets = {}
+    __condition = Condition()
+
+    def __init__(self):
+        self.logger = logging.getLogger()
+
+    @staticmethod
+    def get_limits(host):
+        """
+        Return requests per second and max number of requests in flight of a host
+        """
+        rate = float(Config.get('rate_limit_requests_per_second') or 10)
+        max_in_flight = int(Config.get('rate_limit_max_in_flight') or 8)
+        for entry in clean_split(Config.get('rate_limits') or '', ','):
+            limits = entry.split(':')
+            if limits[0].strip() == host:
+                rate = float(limits[1])
+                max_in_flight = int(limits[2]) if len(limits) > 2 else max_in_flight
+                break
+
+        return rate, max_in_flight
+
+    @staticmethod
+    def __get_bucket(host, rate):
+        """
+        Return bucket of a host, create a full bucket if it does not exist
+        Must be called with condition held
+        """
+        if host not in RateLimiter.__buckets:
+            samples = int(Config.get('rate_limit_wait_samples') or 1000)
+            RateLimiter.__buckets[host] = {'tokens': max(rate, 1),
+                                           'updated': time.time(),
+                                           'in_flight': 0,
+                                           'waiting': 0,
+                                           'requests': 0,
+                                           'waits': deque(maxlen=samples)}
+
+        return RateLimiter.__buckets[host]
+
+    @staticmethod
+    def __refill(bucket, rate):
+        """
+        Add tokens for the time since last refill, bucket holds at most one second
+        worth of tokens, so bursts are limited too
+        """
+        now = time.time()
+        bucket['tokens'] = min(max(rate, 1), bucket['tokens'] + (now - bucket['updated']) * rate)
+        bucket['updated'] = now
+
+    @contextmanager
+    def limit(self, host):
+        """
+        Wait until a request to the host is allowed and hold an in-flight slot
+        for the duration of with block
+        Rate of zero or less means that number of requests per second is not limited
+        """
+        rate, max_in_flight = self.get_limits(host)
+        start = time.time()
+        with RateLimiter.__condition:
+            bucket = self.__get_bucket(host, rate)
+            bucket['waiting'] += 1
+            while True:
+                if rate > 0:
+                    self.__refill(bucket, rate)
+
+                has_token = rate <= 0 or bucket['tokens'] >= 1
+                if has_token and bucket['in_flight'] < max_in_flight:
+                    break
+
+                # Wake up when the next token is added or when a slot is released
+                timeout = (1 - bucket['tokens']) / rate if not has_token else 1
+                RateLimiter.__condition.wait(max(timeout, 0.001))
+
+            if rate > 0:
+                bucket['tokens'] -= 1
+
+            bucket['waiting'] -= 1
+            bucket['in_flight'] += 1
+            bucket['requests'] += 1
+            wait = time.time() - start
+            bucket['waits'].append(wait)
+
+        if wait > 1:
+            self.logger.debug('Request to %s waited %.2fs for rate limiter', host, wait)
+
+        try:
+            yield
+        finally:
+            with RateLimiter.__condition:
+                bucket['in_flight'] -= 1
+                RateLimiter.__condition.notify_all()
+
+    def get_status(self):
+        """
+        Return limits, requests in flight, waiting requests and wait times of each host
+        """
+        status = {}
+        with RateLimiter.__condition:
+            for host, bucket in RateLimiter.__buckets.items():
+                rate, max_in_flight = self.get_limits(host)
+                waits = sorted(bucket['waits'])
+                host_status = {'requests_per_second': rate,
+                               'max_in_flight': max_in_flight,
+                               'in_flight': bucket['in_flight'],
+                               'waiting': bucket['waiting'],
+                               'requests': bucket['requests'],
+                               'wait_mean': 0,
+                               'wait_p95': 0,
+                               'wait_max': 0}
+                if waits:
+                    host_status['wait_mean'] = round(sum(waits) / len(waits), 3)
+                    host_status['wait_p95'] = round(waits[max(0, int(len(waits) * 0.95) - 1)], 3)
+                    host_status['wait_max'] = round(waits[-1], 3)
+
+                status[host] = host_status
+
+        return status
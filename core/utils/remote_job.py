@@ -0,0 +1,105 @@
+"""
+Module that contains RemoteJob class
+"""
+import io
+import base64
+import shlex
+import tarfile
+from core.utils.remote_workspace import RemoteWorkspace
+
+
+class RemoteJob(RemoteWorkspace):
+    """
+    Script that is run in a remote directory in a single round trip
+    Workspace files are sent in the standard input of the command and selected
+    output files are sent back in the standard output after the output of the script
+    """
+
+    __output_marker = '__RELVAL_REMOTE_JOB_OUTPUT__'
+
+    def __init__(self, remote_directory, clean_up=True):
+        super().__init__(remote_directory)
+        # Whether remote directory is removed after the script
+        self.clean_up = clean_up
+        self.outputs = []
+
+    def add_output(self, file_name):
+        """
+        Add a file in the remote directory that will be returned after the script
+        """
+        self.outputs.append(file_name)
+
+    def get_command(self, script, timeout=None, unpack=True):
+        """
+        Return command that unpacks the archive from standard input, runs the
+        script with a time limit, prints output files and cleans up
+        """
+        if isinstance(script, list):
+            script = '\n'.join(script)
+
+        directory = self.remote_directory
+        command = []
+        if unpack:
+            command += [' && '.join(self.get_unpack_command()) + ' || exit $?']
+
+        time_limit = f'timeout --kill-after=60 {timeout} ' if timeout else ''
+        command += [f'cd {directory} || exit $?',
+                    f'{time_limit}bash -c {shlex.quote(script)}',
+                    'JOB_EXIT_CODE=$?',
+                    f'printf "\\n%s\\n" "{RemoteJob.__output_marker}"']
+        if self.outputs:
+            outputs = ' '.join(shlex.quote(x) for x in self.outputs)
+            command += [f'tar -czf - {outputs} 2>/dev/null | base64 | tr -d "\\n"']
+
+        if self.clean_up:
+            command += ['cd', f'rm -rf {directory}']
+
+        command += ['exit $JOB_EXIT_CODE']
+        return '\n'.join(command)
+
+    def __read_outputs(self, encoded):
+        """
+        Return dictionary of output file names and contents from base64 encoded archive
+        """
+        files = {}
+        if not encoded.strip():
+            return files
+
+        archive = io.BytesIO(base64.b64decode(encoded.strip()))
+        with tarfile.open(fileobj=archive, mode='r:gz') as tar:
+            for member in tar.getmembers():
+                if member.isfile() and member.name in self.outputs:
+                    files[member.name] = tar.extractfile(member).read().decode('utf-8')
+
+        return files
+
+    def run(self, executor, script, timeout=None, retry=False):
+        """
+        Send workspace files, run the script and collect output files in one command
+        Workspace files replace remote directory, if there are no files, script is
+        run in the existing directory
+        Job is repeated after transient connection errors only if retry is set
+        Return stdout and stderr of the script, exit code and dictionary of output files
+        """
+        unpack = bool(self.files or self.helpers)
+        input_data = self.get_archive(executor.host) if unpack else b''
+        command = self.get_command(script, timeout, unpack)
+        self.logger.debug('Running job in %s on %s with %s bytes of input',
+                          self.remote_directory,
+                          executor.host,
+                          len(input_data))
+        # Connection is given up a bit after the remote timeout, so normally remote
+        # timeout stops the script and outputs are still collected
+        deadline = timeout + 60 if timeout else None
+        stdout, stderr, exit_code = executor.run(command, input_data, deadline, retry)
+        marker = f'\n{RemoteJob.__output_marker}\n'
+        marker_index = stdout.rfind(marker)
+        if unpack:
+            # Marker is printed only if workspace was unpacked successfully
+            self.set_unpacked(executor.host, marker_index >= 0)
+
+        if marker_index < 0:
+            return stdout, stderr, exit_code, {}
+
+        files = self.__read_outputs(stdout[marker_index + len(marker):])
+        return stdout[:marker_index], stderr, exit_code, files
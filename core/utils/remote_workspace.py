@@ -0,0 +1,119 @@
+"""
+Module that contains RemoteWorkspace class
+"""
+import io
+import time
+import tarfile
+import hashlib
+import logging
+from threading import Lock
+from core_lib.utils.global_config import Config
+
+
+class RemoteWorkspace():
+    """
+    Remote directory with files that is sent as a single in-memory archive
+    Static helper files are stored in the remote area once per content hash
+    and are linked to workspaces that use them
+    """
+
+    # Tuples of host and content hash of helper files that are known to be in
+    # the remote area of that host
+    __helpers = set()
+    __helpers_lock = Lock()
+
+    def __init__(self, remote_directory):
+        self.logger = logging.getLogger()
+        self.remote_directory = remote_directory
+        remote_path = Config.get('remote_path').rstrip('/')
+        self.helpers_directory = f'$HOME/{remote_path}/helpers'
+        # File name to content
+        self.files = {}
+        # Helper file name to tuple of content hash and content
+        self.helpers = {}
+        # Helpers that are not known to be in the remote area when archive is built
+        self.missing_helpers = {}
+
+    def add_file(self, file_name, content):
+        """
+        Add a file with given content to the workspace
+        """
+        self.files[file_name] = content.encode('utf-8')
+
+    def add_helper(self, file_name, local_path):
+        """
+        Add a static helper file from local path to the workspace
+        """
+        with open(local_path, 'rb') as helper_file:
+            content = helper_file.read()
+
+        content_hash = hashlib.sha256(content).hexdigest()[:16]
+        self.helpers[file_name] = (content_hash, content)
+
+    def __build_archive(self, helpers):
+        """
+        Return gzipped tar archive of workspace files and given helper files
+        """
+        archive = io.BytesIO()
+        now = int(time.time())
+        with tarfile.open(fileobj=archive, mode='w:gz') as tar:
+            entries = list(self.files.items())
+            for file_name, (content_hash, content) in helpers.items():
+                entries.append((f'.helpers/{content_hash}/{file_name}', content))
+
+            for file_name, content in entries:
+                info = tarfile.TarInfo(file_name)
+                info.size = len(content)
+                info.mtime = now
+                info.mode = 0o755 if file_name.endswith(('.sh', '.py')) else 0o644
+                tar.addfile(info, io.BytesIO(content))
+
+        archive.seek(0)
+        return archive
+
+    def get_archive(self, host):
+        """
+        Return gzipped tar archive of workspace files and helper files that
+        are not known to be in the remote area of the host
+        """
+        with RemoteWorkspace.__helpers_lock:
+            self.missing_helpers = {k: v for k, v in self.helpers.items()
+                                    if (host, v[0]) not in RemoteWorkspace.__helpers}
+
+        return self.__build_archive(self.missing_helpers).getvalue()
+
+    def get_unpack_command(self, archive_path='-'):
+        """
+        Return list of commands that replace remote directory with contents of
+        the archive and link helper files to it
+        Archive is read from standard input by default
+        """
+        directory = self.remote_directory
+        command = [f'rm -rf {directory}',
+                   f'mkdir -p {directory}',
+                   f'tar -xzf {archive_path} -C {directory}']
+        for file_name, (content_hash, _) in self.missing_helpers.items():
+            helper_directory = f'{self.helpers_directory}/{content_hash}'
+            command += [f'mkdir -p {helper_directory}',
+                        f'mv -f {directory}/.helpers/{content_hash}/{file_name} '
+                        f'{helper_directory}/{file_name}']
+
+        command += [f'rm -rf {directory}/.helpers']
+        for file_name, (content_hash, _) in self.helpers.items():
+            helper_path = f'{self.helpers_directory}/{content_hash}/{file_name}'
+            command += [f'test -f {helper_path}',
+                        f'ln -sfn {helper_path} {directory}/{file_name}']
+
+        return command
+
+    def set_unpacked(self, host, success):
+        """
+        Remember whether helper files are in the remote area of the host after unpacking
+        """
+        with RemoteWorkspace.__helpers_lock:
+            hashes = [(host, v[0]) for v in self.helpers.values()]
+            if success:
+                RemoteWorkspace.__helpers.update(hashes)
+            else:
+                # Helpers will be uploaded again next time
+                RemoteWorkspace.__helpers.difference_update(hashes)
@@ -0,0 +1,176 @@
+"""
+Module that contains ReqMgrClient class
+"""
+import json
+import time
+import logging
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from core_lib.utils.global_config import Config
+from core.utils.retrying_connection import RetryingConnectionWrapper
+
+
+class ReqMgrClient():
+    """
+    Process-wide thread-safe ReqMgr2 client
+    Keep-alive connections are kept in a pool and reused by all threads, so
+    requests do not need a new TLS handshake, connections that were idle for longer
+    than "reqmgr_idle_timeout" are closed, because server might have closed them
+    Requests are not made after deadline, e.g. end of stage timeout, has passed
+    Batches of requests are sent concurrently, number of concurrent requests is
+    bounded by "reqmgr_max_concurrent"
+    """
+
+    # Idle keep-alive connections - list of (connection, last used time)
+    __idle = []
+    __lock = Lock()
+    __headers = {'Content-type': 'application/json',
+                 'Accept': 'application/json'}
+    # Statuses of workflows that will not run
+    inactive_statuses = ('aborted', 'rejected', 'failed', 'aborted-completed',
+                         'aborted-archived', 'rejected-archived')
+
+    def __init__(self):
+        self.logger = logging.getLogger()
+
+    @staticmethod
+    def __create_connection():
+        """
+        Return a new keep-alive connection to ReqMgr2
+        """
+        return RetryingConnectionWrapper(host=Config.get('cmsweb_url'),
+                                         timeout=int(Config.get('reqmgr_timeout') or 120),
+                                         keep_open=True,
+                                         cert_file=Config.get('grid_user_cert'),
+                                         key_file=Config.get('grid_user_key'))
+
+    @contextmanager
+    def __connection(self):
+        """
+        Borrow a pooled connection for the duration of with block
+        Connection is closed instead of returned to the pool if block raised
+        an exception or pool is full
+        """
+        idle_timeout = int(Config.get('reqmgr_idle_timeout') or 30)
+        now = time.time()
+        with ReqMgrClient.__lock:
+            expired = [x for x, used in ReqMgrClient.__idle if now - used > idle_timeout]
+            ReqMgrClient.__idle = [x for x in ReqMgrClient.__idle if now - x[1] <= idle_timeout]
+            connection = ReqMgrClient.__idle.pop()[0] if ReqMgrClient.__idle else None
+
+        for expired_connection in expired:
+            expired_connection.close()
+
+        if connection is None:
+            connection = self.__create_connection()
+
+        try:
+            yield connection
+        except Exception:
+            connection.close()
+            raise
+
+        max_idle = int(Config.get('reqmgr_max_concurrent') or 4)
+        with ReqMgrClient.__lock:
+            if len(ReqMgrClient.__idle) < max_idle:
+                ReqMgrClient.__idle.append((connection, time.time()))
+                return
+
+        connection.close()
+
+    def __run_concurrently(self, function, items):
+        """
+        Call function with each item in a bounded number of threads
+        Return dictionary of items and tuples of result and error message
+        """
+        results = {}
+        if not items:
+            return results
+
+        max_concurrent = int(Config.get('reqmgr_max_concurrent') or 4)
+        with ThreadPoolExecutor(max_workers=min(max_concurrent, len(items))) as pool:
+            futures = {item: pool.submit(function, item) for item in items}
+            for item, future in futures.items():
+                try:
+                    results[item] = (future.result(), None)
+                except Exception as ex:
+                    self.logger.error('ReqMgr2 request for %s failed: %s', item, ex)
+                    results[item] = (None, str(ex))
+
+        return results
+
+    def submit(self, job_dict, deadline=None):
+        """
+        Submit a job dict to ReqMgr2 and return workflow name
+        """
+        with self.__connection() as connection:
+            response = connection.api('POST',
+                                      '/reqmgr2/data/request',
+                                      job_dict,
+                                      self.__headers,
+                                      deadline)
+
+        try:
+            workflow_name = json.loads(response)['result'][0]['request']
+        except Exception as ex:
+            raise Exception(f'Error submitting to ReqMgr2: {response}') from ex
+
+        self.logger.info('Submitted %s', workflow_name)
+        return workflow_name
+
+    def submit_many(self, job_dicts, deadline=None):
+        """
+        Submit dictionary of keys and job dicts concurrently
+        Return dictionary of keys and tuples of workflow name and error message
+        """
+        return self.__run_concurrently(lambda key: self.submit(job_dicts[key], deadline),
+                                       list(job_dicts))
+
+    def approve(self, workflow_name, deadline=None):
+        """
+        Move workflow to assignment-approved status
+        """
+        with self.__connection() as connection:
+            response = connection.api('PUT',
+                                      f'/reqmgr2/data/request/{workflow_name}',
+                                      {'RequestStatus': 'assignment-approved'},
+                                      self.__headers,
+                                      deadline)
+
+        if not json.loads(response).get('result'):
+            raise Exception(f'Error approving {workflow_name}: {response}')
+
+        self.logger.info('Approved %s', workflow_name)
+
+    def approve_many(self, workflow_names, deadline=None):
+        """
+        Approve list of workflows concurrently
+        Return dictionary of workflow names and error messages of failed approvals
+        """
+        results = self.__run_concurrently(lambda name: self.approve(name, deadline),
+                                          workflow_names)
+        return {name: error for name, (_, error) in results.items() if error}
+
+    def get_statuses(self, workflow_names, deadline=None):
+        """
+        Return dictionary of workflow names and their statuses in ReqMgr2
+        Status is None if workflow is not in ReqMgr2 yet
+        Statuses of multiple workflows are fetched with one request
+        """
+        statuses = {name: None for name in workflow_names}
+        chunk_size = 50
+        for start in range(0, len(workflow_names), chunk_size):
+            names = workflow_names[start:start + chunk_size]
+            query = '&'.join(f'name={name}' for name in names)
+            with self.__connection() as connection:
+                response = connection.api('GET',
+                                          f'/reqmgr2/data/request?{query}',
+                                          deadline=deadline)
+
+            for result in json.loads(response).get('result', []):
+                for name in names:
+                    if name in result:
+                        statuses[name] = result[name].get('RequestStatus')
+
+        return statuses
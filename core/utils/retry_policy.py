@@ -0,0 +1,105 @@
+"""
+Module that contains RetryPolicy class
+"""
+import time
+import random
+import socket
+import logging
+import http.client
+from core_lib.utils.global_config import Config
+from core.utils.submission_metrics import SubmissionMetrics
+
+
+class RetryPolicy():
+    """
+    Retry of calls that fail with transient errors, e.g. dropped connections,
+    timeouts or unavailable services, with jittered exponential backoff
+    Permanent errors and errors of the last attempt are raised
+    """
+
+    # HTTP statuses of responses of overloaded, restarting or unreachable services
+    transient_statuses = (429, 502, 503, 504)
+    # HTTP statuses of responses that mean that request was not processed
+    not_sent_statuses = (429, 503)
+    # Dropped connections, timeouts and failed name lookups
+    transient_errors = (ConnectionError,
+                        TimeoutError,
+                        socket.timeout,
+                        socket.gaierror,
+                        EOFError,
+                        http.client.BadStatusLine,
+                        http.client.IncompleteRead)
+    # Errors that mean that request could not reach the service
+    not_sent_errors = (ConnectionRefusedError, socket.gaierror)
+    # SSH library errors are checked by name to avoid depending on it here
+    transient_ssh_errors = ('SSHException', 'NoValidConnectionsError')
+    not_sent_ssh_errors = ('NoValidConnectionsError', )
+    permanent_ssh_errors = ('AuthenticationException',
+                            'BadHostKeyException',
+                            'PasswordRequiredException')
+
+    def __init__(self, operation, repeatable=True):
+        """
+        Operation is the name used in logs and metrics
+        Operations that are not repeatable are retried only if they surely did not
+        reach the service, e.g. connection was refused
+        """
+        self.logger = logging.getLogger()
+        self.operation = operation
+        self.repeatable = repeatable
+
+    def is_transient(self, error):
+        """
+        Return whether error is transient and call can be retried
+        Errors are classified by their type and HTTP status, errors of other types,
+        e.g. missing files or denied permissions, are permanent
+        """
+        status = getattr(error, 'status', None)
+        if isinstance(status, int):
+            if self.repeatable:
+                return status in self.transient_statuses
+
+            return status in self.not_sent_statuses
+
+        names = {x.__name__ for x in type(error).__mro__}
+        if not self.repeatable:
+            return (isinstance(error, self.not_sent_errors)
+                    or bool(names.intersection(self.not_sent_ssh_errors)))
+
+        if names.intersection(self.permanent_ssh_errors):
+            return False
+
+        return (isinstance(error, self.transient_errors)
+                or bool(names.intersection(self.transient_ssh_errors)))
+
+    def call(self, function, *args, on_retry=None, **kwargs):
+        """
+        Call a function and retry it if it fails with a transient error
+        Function on_retry is called before each retry, e.g. to reset a connection
+        """
+        attempts = int(Config.get('retry_attempts') or 3)
+        delay = float(Config.get('retry_delay') or 1)
+        max_delay = float(Config.get('retry_max_delay') or 30)
+        attempt = 1
+        while True:
+            try:
+                return function(*args, **kwargs)
+            except Exception as ex:
+                if attempt >= attempts or not self.is_transient(ex):
+                    raise
+
+                # Full jitter spreads retries of concurrent callers
+                sleep = random.uniform(0, min(max_delay, delay * 2 ** (attempt - 1)))
+                self.logger.warning('%s failed with transient error (attempt %s/%s), '
+                                    'retrying in %.1fs: %s',
+                                    self.operation,
+                                    attempt,
+                                    attempts,
+                                    sleep,
+                                    ex)
+                SubmissionMetrics().record_retry(self.operation, ex)
+                time.sleep(sleep)
+                if on_retry:
+                    on_retry()
+
+                attempt += 1
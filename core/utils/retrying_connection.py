@@ -0,0 +1,168 @@
+"""
+Module that contains RetryingConnectionWrapper class
+"""
+import ssl
+import json
+import time
+import logging
+import http.client
+from core_lib.utils.connection_wrapper import ConnectionWrapper
+from core.utils.retry_policy import RetryPolicy
+from core.utils.rate_limiter import RateLimiter
+
+
+class HTTPStatusError(Exception):
+    """
+    Error of a request whose response has a transient error status
+    """
+
+    def __init__(self, status, response):
+        super().__init__(f'HTTP status {status}: {response[:200]!r}')
+        self.status = status
+        self.response = response
+
+
+class RetryingConnectionWrapper(ConnectionWrapper):
+    """
+    Connection wrapper that retries requests that fail with transient errors
+    Requests are made here instead of the base wrapper, so HTTP status of the
+    response is known and transient statuses, e.g. 502 or 503, can be retried
+    Requests with methods that are not repeatable, by default POST, are retried
+    only if they did not reach the service
+    Request on a reused keep-alive connection that server already closed is sent
+    once more over a new connection
+    Every attempt goes through the rate limiter of the host
+    """
+
+    def __init__(self, host, port=443, https=True, timeout=120, keep_open=False,
+                 cert_file=None, key_file=None, repeatable_methods=('GET', 'PUT', 'DELETE')):
+        super().__init__(host=host,
+                         port=port,
+                         https=https,
+                         timeout=timeout,
+                         keep_open=keep_open,
+                         cert_file=cert_file,
+                         key_file=key_file)
+        # Host name without scheme is used in logs, metrics and rate limits
+        self.retry_host = host.split('://')[-1].rstrip('/')
+        self.repeatable_methods = repeatable_methods
+        self.__port = port
+        self.__https = https and not host.startswith('http://')
+        self.__timeout = timeout
+        self.__keep_open = keep_open
+        self.__cert_file = cert_file
+        self.__key_file = key_file
+        self.__connection = None
+
+    def __get_connection(self):
+        """
+        Return open connection, create it if it does not exist
+        """
+        if self.__connection is None:
+            if self.__https:
+                context = ssl.create_default_context()
+                if self.__cert_file:
+                    context.load_cert_chain(self.__cert_file, self.__key_file)
+
+                self.__connection = http.client.HTTPSConnection(self.retry_host,
+                                                                self.__port,
+                                                                timeout=self.__timeout,
+                                                                context=context)
+            else:
+                self.__connection = http.client.HTTPConnection(self.retry_host,
+                                                               self.__port,
+                                                               timeout=self.__timeout)
+
+        return self.__connection
+
+    def close(self):
+        """
+        Close the connection, next request opens a new one
+        """
+        if self.__connection is not None:
+            self.__connection.close()
+            self.__connection = None
+
+    def __reset(self):
+        """
+        Close connection, so next attempt uses a new one
+        """
+        try:
+            self.close()
+        except Exception as ex:
+            logging.getLogger().warning('Error closing connection to %s: %s',
+                                        self.retry_host,
+                                        ex)
+
+    def __send(self, method, url, data, headers, timeout):
+        """
+        Send a request and return response
+        Server closes idle keep-alive connections, if reused connection was closed
+        before any response was received, request did not reach the service, so it
+        is sent again over a new connection
+        """
+        reused = self.__connection is not None
+        while True:
+            connection = self.__get_connection()
+            connection.timeout = timeout
+            if connection.sock is not None:
+                connection.sock.settimeout(timeout)
+
+            try:
+                connection.request(method, url, data, headers=headers)
+                return connection.getresponse()
+            except (ConnectionResetError, BrokenPipeError):
+                if not reused:
+                    raise
+
+                logging.getLogger().debug('Reused connection to %s was closed, reconnecting',
+                                          self.retry_host)
+                self.__reset()
+                reused = False
+
+    def __request(self, method, url, data=None, headers=None, deadline=None):
+        """
+        Make a request when rate limiter of the host allows it and return response
+        Request does not wait longer than connection timeout or until deadline
+        Raise HTTPStatusError if response has a transient error status
+        """
+        if data is not None and not isinstance(data, (str, bytes)):
+            data = json.dumps(data)
+
+        timeout = self.__timeout
+        if deadline:
+            timeout = min(timeout, deadline - time.time())
+            if timeout <= 0:
+                raise Exception(f'{method} {self.retry_host} did not finish before deadline')
+
+        with RateLimiter().limit(self.retry_host):
+            response = self.__send(method,
+                                   url.replace('#', '%23'),
+                                   data,
+                                   headers or {},
+                                   timeout)
+            content = response.read()
+
+        if not self.__keep_open:
+            self.close()
+
+        if response.status in RetryPolicy.transient_statuses:
+            raise HTTPStatusError(response.status, content)
+
+        return content
+
+    def api(self, method, url, data=None, headers=None, deadline=None):
+        """
+        Make a request, retry it if it fails with a transient error and return content
+        of the response
+        Attempts are not made after deadline, a timestamp, has passed
+        """
+        policy = RetryPolicy(f'{method} {self.retry_host}',
+                             repeatable=method.upper() in self.repeatable_methods)
+        return policy.call(self.__request,
+                           method,
+                           url,
+                           data,
+                           headers,
+                           deadline,
+                           on_retry=self.__reset)
@@ -0,0 +1,104 @@
+"""
+Module that contains SSHPool class
+"""
+import time
+import logging
+from contextlib import contextmanager
+from threading import Lock
+from core_lib.utils.global_config import Config
+from core.utils.executor import SSHBackend
+
+
+class SSHPool():
+    """
+    Process-wide pool of SSH connections
+    Authenticated connections are kept per host and credentials and reused
+    Pool does not limit number of connections that are in use, HostBalancer does it
+    for connections borrowed through ExecutorPool
+    """
+
+    # Idle connections - (host, credentials) key to list of (executor, last used time)
+    __idle = {}
+    __lock = Lock()
+
+    def __init__(self):
+        self.logger = logging.getLogger()
+
+    def __close(self, ssh_executor):
+        """
+        Close executor's connections
+        """
+        try:
+            ssh_executor.close_connections()
+        except Exception as ex:
+            self.logger.warning('Error closing SSH connection: %s', ex)
+
+    def __evict_idle(self):
+        """
+        Close and remove connections that were not used for longer than idle timeout
+        """
+        idle_timeout = int(Config.get('ssh_idle_timeout') or 600)
+        now = time.time()
+        to_close = []
+        with SSHPool.__lock:
+            for key, idle in SSHPool.__idle.items():
+                expired = [x for x in idle if now - x[1] > idle_timeout]
+                if expired:
+                    SSHPool.__idle[key] = [x for x in idle if now - x[1] <= idle_timeout]
+                    to_close.extend((key[0], x[0]) for x in expired)
+
+        for host, ssh_executor in to_close:
+            self.logger.debug('Closing idle SSH connection to %s', host)
+            self.__close(ssh_executor)
+
+    def __take_idle(self, key):
+        """
+        Return an idle healthy connection for given key or None if there are none
+        """
+        while True:
+            with SSHPool.__lock:
+                idle = SSHPool.__idle.get(key)
+                if not idle:
+                    return None
+
+                ssh_executor, _ = idle.pop()
+
+            if ssh_executor.is_alive():
+                return ssh_executor
+
+            self.logger.info('Dropping dead SSH connection to %s', key[0])
+            self.__close(ssh_executor)
+
+    @contextmanager
+    def borrow(self, host, credentials_path):
+        """
+        Borrow a connection to given host for the duration of with block
+        """
+        self.__evict_idle()
+        key = (host, credentials_path)
+        ssh_executor = None
+        try:
+            ssh_executor = self.__take_idle(key)
+            if ssh_executor is None:
+                self.logger.debug('Creating new SSH connection to %s', host)
+                ssh_executor = SSHBackend(host, credentials_path)
+
+            yield ssh_executor
+        finally:
+            if ssh_executor is not None:
+                if ssh_executor.is_alive():
+                    with SSHPool.__lock:
+                        SSHPool.__idle.setdefault(key, []).append((ssh_executor, time.time()))
+                else:
+                    self.__close(ssh_executor)
+
+    def get_status(self):
+        """
+        Return number of idle connections of each host
+        """
+        with SSHPool.__lock:
+            status = {}
+            for (host, _), idle in SSHPool.__idle.items():
+                status[host] = status.get(host, 0) + len(idle)
+
+            return status
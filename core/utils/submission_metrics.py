@@ -0,0 +1,126 @@
+"""
+Module that contains SubmissionMetrics class
+"""
+import time
+import logging
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+from threading import Lock
+from core_lib.utils.global_config import Config
+
+
+class SubmissionMetrics():
+    """
+    Process-wide rolling histograms of submission stage durations
+    Durations and outcomes are kept per stage and CMSSW release and
+    per RelVal for the most recent RelVals
+    """
+
+    # (stage, CMSSW release) to deque of (duration, outcome)
+    __samples = {}
+    # Prepid to dictionary of stage durations and outcomes
+    __relvals = OrderedDict()
+    # Operation to dictionary of error types and number of retries
+    __retries = {}
+    __lock = Lock()
+
+    def __init__(self):
+        self.logger = logging.getLogger()
+
+    def record(self, stage, cmssw_release, duration, outcome, prepids=None):
+        """
+        Record duration and outcome of a stage for given RelVals
+        """
+        self.logger.debug('Stage %s of %s took %.2fs and %s',
+                          stage,
+                          ', '.join(prepids or []),
+                          duration,
+                          outcome)
+        max_samples = int(Config.get('submission_metrics_samples') or 1000)
+        max_relvals = int(Config.get('submission_metrics_relvals') or 500)
+        now = int(time.time())
+        with SubmissionMetrics.__lock:
+            key = (stage, cmssw_release)
+            if key not in SubmissionMetrics.__samples:
+                SubmissionMetrics.__samples[key] = deque(maxlen=max_samples)
+
+            SubmissionMetrics.__samples[key].append((duration, outcome))
+            for prepid in prepids or []:
+                relval_stages = SubmissionMetrics.__relvals.pop(prepid, {})
+                relval_stages[stage] = {'duration': round(duration, 3),
+                                        'outcome': outcome,
+                                        'time': now}
+                SubmissionMetrics.__relvals[prepid] = relval_stages
+
+            while len(SubmissionMetrics.__relvals) > max_relvals:
+                SubmissionMetrics.__relvals.popitem(last=False)
+
+    @contextmanager
+    def measure(self, stage, cmssw_release, prepids=None):
+        """
+        Measure duration of the with block and record it as succeeded
+        or failed depending on whether block raised an exception
+        """
+        start = time.time()
+        outcome = 'failed'
+        try:
+            yield
+            outcome = 'succeeded'
+        finally:
+            self.record(stage, cmssw_release, time.time() - start, outcome, prepids)
+
+    def record_retry(self, operation, error):
+        """
+        Record a retry of an operation that failed with a transient error
+        """
+        error_type = type(error).__name__
+        with SubmissionMetrics.__lock:
+            operation_retries = SubmissionMetrics.__retries.setdefault(operation, {})
+            operation_retries[error_type] = operation_retries.get(error_type, 0) + 1
+
+    def get_retries(self):
+        """
+        Return number of retries of each operation by error type
+        """
+        with SubmissionMetrics.__lock:
+            return {k: dict(v) for k, v in SubmissionMetrics.__retries.items()}
+
+    @staticmethod
+    def __percentile(durations, percentile):
+        """
+        Return percentile of sorted list of durations using nearest rank
+        """
+        index = max(0, int(round(percentile / 100.0 * len(durations))) - 1)
+        return round(durations[index], 3)
+
+    def get_histograms(self):
+        """
+        Return count, failures, mean, p50, p95 and p99 of each stage and CMSSW release
+        """
+        with SubmissionMetrics.__lock:
+            samples = {k: list(v) for k, v in SubmissionMetrics.__samples.items()}
+
+        histograms = {}
+        for (stage, cmssw_release), stage_samples in samples.items():
+            durations = sorted(x[0] for x in stage_samples)
+            failed = len([x for x in stage_samples if x[1] != 'succeeded'])
+            histograms.setdefault(stage, {})[cmssw_release] = {
+                'count': len(durations),
+                'failed': failed,
+                'mean': round(sum(durations) / len(durations), 3),
+                'p50': self.__percentile(durations, 50),
+                'p95': self.__percentile(durations, 95),
+                'p99': self.__percentile(durations, 99),
+            }
+
+        return histograms
+
+    def get_relval_breakdown(self, prepid=None):
+        """
+        Return stage durations and outcomes of recent RelVals or of a single RelVal
+        """
+        with SubmissionMetrics.__lock:
+            if prepid:
+                return {prepid: dict(SubmissionMetrics.__relvals.get(prepid, {}))}
+
+            return {k: dict(v) for k, v in SubmissionMetrics.__relvals.items()}
@@ -0,0 +1,68 @@
+"""
+Module that contains SubmissionQueue class
+"""
+import time
+import logging
+from core_lib.database.database import Database
+
+
+class SubmissionQueue():
+    """
+    Persistent submission queue
+    Keeps prepid, campaign and stage checkpoint of each RelVal that is being submitted,
+    so submission can be resumed after a restart and queue can be seen by all processes
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger()
+        self.collection = Database('submission_queue').collection
+
+    def add(self, prepid, batch_key, priority=0, user=''):
+        """
+        Add a RelVal with it's submission priority and user who submitted it to the queue
+        Return False if RelVal is already in the queue
+        """
+        now = int(time.time())
+        result = self.collection.update_one({'_id': prepid},
+                                            {'$setOnInsert': {'prepid': prepid,
+                                                              'batch_key': batch_key,
+                                                              'priority': priority,
+                                                              'user': user,
+                                                              'stage': 'pending',
+                                                              'data': {},
+                                                              'added': now,
+                                                              'updated': now}},
+                                            upsert=True)
+        if result.upserted_id is None:
+            self.logger.info('%s is already in submission queue', prepid)
+            return False
+
+        return True
+
+    def set_stage(self, prepid, stage, data=None):
+        """
+        Save stage checkpoint of a RelVal with data needed to resume that stage
+        """
+        self.logger.debug('Checkpoint %s at %s stage', prepid, stage)
+        self.collection.update_one({'_id': prepid},
+                                   {'$set': {'stage': stage,
+                                             'data': data or {},
+                                             'updated': int(time.time())}})
+
+    def remove(self, prepid):
+        """
+        Remove a RelVal from the queue
+        """
+        self.collection.delete_one({'_id': prepid})
+
+    def get(self, prepid):
+        """
+        Return entry of a RelVal or None if RelVal is not in the queue
+        """
+        return self.collection.find_one({'_id': prepid})
+
+    def get_all(self):
+        """
+        Return all entries of the queue in the order they were added
+        """
+        return list(self.collection.find({}).sort('added', 1))
@@ -0,0 +1,279 @@
+"""
+Module that contains SubmissionStage class
+"""
+import time
+import logging
+from queue import Empty
+from collections import deque
+from threading import Thread, Lock, Timer
+from core.utils.fair_share_queue import FairShareQueue
+
+
+class SubmissionStage():
+    """
+    One stage of submission pipeline
+    Stage has a bounded input queue and it's own worker threads that run stage
+    function for each item and pass returned items to the next stage
+    Items are dictionaries and list of RelVal prepids of an item is in "prepids"
+    Queued items are ordered by FairShareQueue using priority, user and campaign
+    returned by schedule key function
+    """
+
+    def __init__(self, name, function, workers_count, queue_size=0, timeout=None,
+                 schedule_key=None):
+        self.name = name
+        self.function = function
+        self.timeout = timeout
+        self.next_stage = None
+        self.logger = logging.getLogger()
+        key = (lambda entry: schedule_key(entry[1])) if schedule_key else None
+        self.__queue = FairShareQueue(maxsize=queue_size, key=key)
+        # Durations of recently finished jobs
+        self.__durations = deque(maxlen=100)
+        # Worker name to tuple of job name, start time and item
+        self.__jobs = {}
+        self.__jobs_lock = Lock()
+        # Workers that were replaced while running a cancelled job
+        self.__abandoned = set()
+        # Number of workers that will stop before taking their next job
+        self.__stopping = 0
+        self.__workers_started = 0
+        # Items that will be added to the queue after a delay
+        self.__delayed = []
+        for _ in range(workers_count):
+            self.__start_worker()
+
+    def __start_worker(self):
+        """
+        Start a new worker thread
+        Must be called with jobs lock held or during initialization
+        """
+        self.__workers_started += 1
+        worker_name = f'{self.name}-{self.__workers_started}'
+        self.__jobs[worker_name] = (None, None, None)
+        worker = Thread(target=self.__work, args=(worker_name, ), name=worker_name)
+        worker.daemon = True
+        worker.start()
+
+    def get_workers(self):
+        """
+        Return number of workers of the stage, not counting workers that are stopping
+        """
+        with self.__jobs_lock:
+            return len(self.__jobs) - self.__stopping
+
+    def set_workers(self, count):
+        """
+        Change number of workers of the stage
+        New workers start immediately, extra workers stop before taking their next job
+        """
+        with self.__jobs_lock:
+            current = len(self.__jobs) - self.__stopping
+            if count >= current:
+                # Workers that are about to stop are kept instead of starting new ones
+                kept = min(self.__stopping, count - current)
+                self.__stopping -= kept
+                for _ in range(count - current - kept):
+                    self.__start_worker()
+            else:
+                self.__stopping += current - count
+
+    def put(self, job_name, item):
+        """
+        Add an item to the queue of the stage
+        Block if queue is full
+        """
+        self.logger.debug('Adding %s to %s stage', job_name, self.name)
+        self.__queue.put((job_name, item))
+
+    def put_later(self, job_name, item, delay):
+        """
+        Add an item to the queue of the stage after given number of seconds
+        Worker is not occupied while waiting
+        """
+        self.logger.debug('Adding %s to %s stage in %ss', job_name, self.name, delay)
+        entry = [job_name, item, None]
+
+        def put_delayed():
+            with self.__jobs_lock:
+                if not any(x is entry for x in self.__delayed):
+                    # Item was cancelled
+                    return
+
+                self.__delayed = [x for x in self.__delayed if x is not entry]
+
+            self.put(job_name, item)
+
+        timer = Timer(delay, put_delayed)
+        timer.daemon = True
+        entry[2] = timer
+        with self.__jobs_lock:
+            self.__delayed.append(entry)
+
+        timer.start()
+
+    def __work(self, worker_name):
+        """
+        Main loop of a worker thread
+        """
+        while True:
+            with self.__jobs_lock:
+                stop = self.__stopping > 0
+                if stop:
+                    self.__stopping -= 1
+                    del self.__jobs[worker_name]
+
+            if stop:
+                self.logger.info('Worker %s stops because %s stage is scaled down',
+                                 worker_name,
+                                 self.name)
+                return
+
+            try:
+                # Wait with timeout, so idle worker notices that it should stop
+                job_name, item = self.__queue.get(timeout=1)
+            except Empty:
+                continue
+
+            with self.__jobs_lock:
+                start_time = time.time()
+                self.__jobs[worker_name] = (job_name, start_time, item)
+
+            try:
+                try:
+                    results = self.function(item)
+                except Exception as ex:
+                    self.logger.error('Error in %s stage for %s: %s', self.name, job_name, ex)
+                    results = []
+
+                with self.__jobs_lock:
+                    self.__durations.append(time.time() - start_time)
+                    abandoned = worker_name in self.__abandoned
+
+                # Results are passed on before the job is cleared, so cancellation
+                # always finds their RelVals in one of the stages
+                if self.next_stage and not abandoned:
+                    for next_job_name, next_item in results or []:
+                        self.next_stage.put(next_job_name, next_item)
+            finally:
+                with self.__jobs_lock:
+                    abandoned = worker_name in self.__abandoned
+                    if abandoned:
+                        self.__abandoned.remove(worker_name)
+                    else:
+                        self.__jobs[worker_name] = (None, None, None)
+
+                self.__queue.task_done()
+
+            if abandoned:
+                self.logger.info('Worker %s finished cancelled %s and stops', worker_name, job_name)
+                return
+
+    def cancel(self, prepid, cancelled):
+        """
+        Remove a RelVal from queued and delayed items of the stage
+        If a worker is running a job of only cancelled RelVals, replace the worker
+        with a new one, job will be left to finish on it's own
+        Return "queued", "running" or None if RelVal is not in the stage
+        """
+        found = None
+        with self.__queue.mutex:
+            for entry in list(self.__queue.queue):
+                prepids = entry[1].get('prepids', [])
+                if prepid in prepids:
+                    found = 'queued'
+                    prepids.remove(prepid)
+                    if not prepids:
+                        self.__queue.queue.remove(entry)
+                        # Entry will never be processed
+                        self.__queue.unfinished_tasks -= 1
+                        self.__queue.not_full.notify()
+
+        with self.__jobs_lock:
+            for entry in list(self.__delayed):
+                prepids = entry[1].get('prepids', [])
+                if prepid in prepids:
+                    found = 'queued'
+                    prepids.remove(prepid)
+                    if not prepids:
+                        entry[2].cancel()
+                        self.__delayed = [x for x in self.__delayed if x is not entry]
+
+            for worker_name, (job_name, _, item) in list(self.__jobs.items()):
+                if not item or prepid not in item.get('prepids', []):
+                    continue
+
+                found = 'running'
+                if worker_name in self.__abandoned:
+                    continue
+
+                if set(item['prepids']) <= cancelled:
+                    self.logger.info('Replacing worker %s that runs cancelled %s',
+                                     worker_name,
+                                     job_name)
+                    self.__abandoned.add(worker_name)
+                    del self.__jobs[worker_name]
+                    self.__start_worker()
+
+        return found
+
+    def get_queued_items(self):
+        """
+        Return list of items that are waiting in the queue in the order they will be
+        taken and items that are waiting to be added to the queue
+        """
+        items = [item for _, item in self.__queue.get_order()]
+
+        with self.__jobs_lock:
+            items.extend([entry[1] for entry in self.__delayed])
+
+        return items
+
+    def get_worker_status(self):
+        """
+        Return job name, prepids of the job, time spent on the job and whether job
+        is over the deadline of each worker
+        """
+        now = time.time()
+        with self.__jobs_lock:
+            status = {}
+            for worker_name, (job_name, start_time, item) in self.__jobs.items():
+                job_time = int(now - start_time) if start_time else 0
+                status[worker_name] = {'job_name': job_name,
+                                       'prepids': list((item or {}).get('prepids', [])),
+                                       'job_time': job_time,
+                                       'overdue': bool(self.timeout and job_time > self.timeout)}
+
+            return status
+
+    def get_status(self):
+        """
+        Return number of queued and delayed items, busy workers and all workers of the stage
+        """
+        with self.__jobs_lock:
+            active = len([x for x in self.__jobs.values() if x[0] is not None])
+            workers = len(self.__jobs) - self.__stopping
+            delayed = len(self.__delayed)
+            abandoned = len(self.__abandoned)
+            stopping = self.__stopping
+
+        return {'queued': self.__queue.qsize(),
+                'delayed': delayed,
+                'active': active,
+                'workers': workers,
+                'stopping': stopping,
+                'abandoned': abandoned,
+                'timeout': self.timeout,
+                'mean_duration': round(self.get_mean_duration() or 0, 1)}
+
+    def get_mean_duration(self):
+        """
+        Return mean duration of recently finished jobs or None if no jobs finished yet
+        """
+        with self.__jobs_lock:
+            durations = list(self.__durations)
+
+        if not durations:
+            return None
+
+        return sum(durations) / len(durations)
@@ -0,0 +1,911 @@
+"""
+Module that contains SubmissionStages class
+"""
+import time
+import logging
+from core_lib.utils.locker import Locker
+from core_lib.database.database import Database
+from core_lib.utils.common_utils import clean_split
+from core_lib.utils.global_config import Config
+from core.utils.executor_pool import ExecutorPool
+from core.utils.reqmgr_client import ReqMgrClient
+from core.utils.config_cache import ConfigCache
+from core.utils.submission_queue import SubmissionQueue
+from core.utils.submission_metrics import SubmissionMetrics
+from core.utils.wmcore_checkout import WMCoreCheckout
+from core.utils.remote_job import RemoteJob
+from core.utils.voms_proxy import VOMSProxy
+
+
+class SubmissionStages():
+    """
+    Functions of submission pipeline stages of RequestSubmitter
+    Each function takes an item of it's stage and returns list of job names and
+    items for the next stage
+    Queue, schedule and cancellations of RelVals are kept by the submitter
+    """
+
+    def __init__(self, submitter):
+        self.submitter = submitter
+        self.logger = logging.getLogger()
+
+    @staticmethod
+    def __borrow_executor(host=None):
+        """
+        Borrow an executor that runs config generation and upload
+        Backend is "submission_executor" in config, by default it is "executor"
+        """
+        backend = Config.get('submission_executor') or ExecutorPool.get_backend()
+        return ExecutorPool().borrow(host, backend)
+
+    def __get_batch_generate_script(self):
+        """
+        Return a script that runs config generation of each RelVal given
+        as argument in it's own directory
+        RelVal scripts take CMSSW areas from the remote cache
+        """
+        script = '#!/bin/bash\n\n'
+        script += 'BATCH_DIR=$(pwd)\n\n'
+        script += self.__get_batch_report_function()
+        script += 'for PREPID in "$@"; do\n'
+        script += '  cd $BATCH_DIR/$PREPID\n'
+        script += '  chmod +x config_generate.sh\n'
+        script += '  ./config_generate.sh > generate.log 2>&1\n'
+        script += '  report $PREPID $? generate.log\n'
+        script += 'done\n'
+        return script
+
+    def __get_batch_upload_script(self, setups):
+        """
+        Return a script that checks configs of each RelVal given as argument and
+        uploads configs of all RelVals of the same CMSSW release in one uploader
+        process with shared WMCore checkout
+        Setups is a dictionary of release keys and CMSSW setup scripts
+        """
+        database_url = Config.get('cmsweb_url') + '/couchdb'
+        script = '#!/bin/bash\n\n'
+        script += 'BATCH_DIR=$(pwd)\n\n'
+        script += self.__get_batch_report_function()
+        script += 'setup_cmssw() {\n'
+        script += '  case "$1" in\n'
+        for release_key, setup in setups.items():
+            script += f'    "{release_key}")\n'
+            script += ''.join(f'      {line}\n' for line in setup.split('\n'))
+            script += '      ;;\n'
+
+        script += '  esac\n'
+        script += '}\n\n'
+        script += WMCoreCheckout().get_setup_script()
+        script += '\n'
+        # Scripts of RelVals check their configs and print release keys and config files
+        script += ': > $BATCH_DIR/upload_files\n'
+        script += 'UPLOAD_PREPIDS=""\n'
+        script += 'for PREPID in "$@"; do\n'
+        script += '  cd $BATCH_DIR/$PREPID\n'
+        script += '  chmod +x config_upload.sh\n'
+        script += '  ./config_upload.sh > upload_files 2> upload.log\n'
+        script += '  EXIT_CODE=$?\n'
+        script += '  if [ $EXIT_CODE -ne 0 ]; then\n'
+        script += '    report $PREPID $EXIT_CODE upload.log\n'
+        script += '    continue\n'
+        script += '  fi\n'
+        script += '  while read RELEASE_KEY CONFIG_FILES; do\n'
+        script += '    for CONFIG_FILE in $CONFIG_FILES; do\n'
+        script += '      echo "$RELEASE_KEY $PREPID/$CONFIG_FILE" >> $BATCH_DIR/upload_files\n'
+        script += '    done\n'
+        script += '  done < upload_files\n'
+        script += '  UPLOAD_PREPIDS="$UPLOAD_PREPIDS $PREPID"\n'
+        script += 'done\n\n'
+        # One uploader process and it's connections are used for each release
+        script += 'cd $BATCH_DIR\n'
+        script += ': > upload.log\n'
+        script += 'for RELEASE_KEY in $(cut -d " " -f 1 upload_files | sort -u); do\n'
+        script += '  (setup_cmssw $RELEASE_KEY\n'
+        script += '   cd $BATCH_DIR\n'
+        script += '   python batchConfigUploader.py --group ppd --user $(echo $USER) '
+        script += f'--db {database_url} '
+        script += '$(awk -v KEY=$RELEASE_KEY \'$1 == KEY {print $2}\' upload_files)'
+        script += ') >> upload.log 2>&1\n'
+        script += 'done\n\n'
+        script += self.__get_batch_upload_check()
+        return script
+
+    @staticmethod
+    def __get_batch_upload_check():
+        """
+        Return part of upload script that reports RelVals that had all of their
+        configs uploaded as succeeded and prints their DocIDs
+        """
+        script = 'for PREPID in $UPLOAD_PREPIDS; do\n'
+        script += '  EXPECTED=$(awk -v DIR=$PREPID/ \'index($2, DIR) == 1\' upload_files | wc -l)\n'
+        script += '  awk -v DIR=$PREPID/ \'$1 == "DocID:" && index($4, DIR) == 1\' upload.log '
+        script += '> $PREPID/doc_ids\n'
+        script += '  if [ "$(wc -l < $PREPID/doc_ids)" -eq "$EXPECTED" ]; then\n'
+        script += '    report $PREPID 0 upload.log\n'
+        script += '  else\n'
+        script += '    grep -v "^DocID: " upload.log > $PREPID/upload.log\n'
+        script += '    report $PREPID 1 upload.log\n'
+        script += '  fi\n'
+        script += '  awk -v PREPID=$PREPID \'{print "BatchDocID: " PREPID " DocID: " $2 " " $3}\' '
+        script += '$PREPID/doc_ids\n'
+        script += 'done\n'
+        return script
+
+    @staticmethod
+    def __get_batch_report_function():
+        """
+        Return a bash function that prints exit code of RelVal's script
+        and last lines of it's log if script failed
+        """
+        function = 'report() {\n'
+        function += '  echo "BatchResult: $1 $2"\n'
+        function += '  if [ "$2" -ne 0 ]; then\n'
+        function += '    tail -n 20 $BATCH_DIR/$1/$3 | sed "s/^/BatchLog: $1 /"\n'
+        function += '  fi\n'
+        function += '}\n\n'
+        return function
+
+    def __parse_batch_output(self, stdout):
+        """
+        Split output of batch script into exit codes, logs and DocIDs of each RelVal
+        """
+        results = {}
+        for line in clean_split(stdout, '\n'):
+            line_split = clean_split(line, ' ')
+            if len(line_split) < 2 or line_split[0] not in ('BatchResult:',
+                                                            'BatchLog:',
+                                                            'BatchDocID:'):
+                continue
+
+            prepid = line_split[1]
+            result = results.setdefault(prepid, {'exit_code': None, 'log': [], 'hashes': []})
+            if line_split[0] == 'BatchResult:':
+                result['exit_code'] = int(line_split[2])
+            elif line_split[0] == 'BatchLog:':
+                result['log'].append(line.split(' ', 2)[-1])
+            elif line_split[0] == 'BatchDocID:':
+                # Same as DocID line split by space without the first element
+                result['hashes'].append(tuple(line_split[3:]))
+
+        return results
+
+    def __prepare_workspace(self, relvals, controller, remote_directory, cached_configs):
+        """
+        Return a job that replaces remote directory with a subdirectory for each RelVal
+        and all needed files and generates configs
+        Remote directory is kept after the job, so configs can be uploaded
+        Steps that have cached configs are left out of generation and upload scripts
+        """
+        prepids = [relval.get_prepid() for relval in relvals]
+        self.logger.info('Preparing workspace for %s', ', '.join(prepids))
+        workspace = RemoteJob(remote_directory, clean_up=False)
+        workspace.add_file('config_generate.sh', self.__get_batch_generate_script())
+        # Release keys and CMSSW setup scripts of configs that are uploaded
+        setups = {}
+        for relval in relvals:
+            prepid = relval.get_prepid()
+            skip_configs = cached_configs.get(prepid)
+            for step, _ in relval.get_upload_releases(skip_configs):
+                setups[relval.get_release_key(step)] = relval.get_cmssw_setup(step, True)
+
+            # Config generation script - cmsDrivers
+            workspace.add_file(f'{prepid}/config_generate.sh',
+                               controller.get_cmsdriver(relval,
+                                                        for_submission=True,
+                                                        skip_configs=skip_configs))
+            # Config upload to ReqMgr2 script
+            workspace.add_file(f'{prepid}/config_upload.sh',
+                               controller.get_config_upload_file(relval,
+                                                                 for_batch=True,
+                                                                 skip_configs=skip_configs))
+
+        workspace.add_file('config_upload.sh', self.__get_batch_upload_script(setups))
+        # Python script used by upload script
+        workspace.add_helper('batchConfigUploader.py', './core/utils/batchConfigUploader.py')
+        return workspace
+
+    def __check_for_submission(self, relval):
+        """
+        Perform one last check of values before submitting a RelVal
+        """
+        self.logger.debug('Performing one last check for %s', relval.get_prepid())
+        if relval.get('status') != 'submitting':
+            raise Exception(f'Cannot submit a request with status {relval.get("status")}')
+
+    def __run_batch_script(self, prepids, executor, job, script, action, timeout, retry):
+        """
+        Run a batch script for given RelVals as a remote job and return results of
+        RelVals that succeeded and error messages of RelVals whose part of the script failed
+        Script is killed on the remote machine if it runs longer than timeout
+        Job is repeated after transient connection errors only if retry is set
+        """
+        script = [VOMSProxy().get_export_command(), f'{script} {" ".join(prepids)}']
+        stdout, stderr, exit_code, _ = job.run(executor, script, timeout, retry)
+        self.logger.debug('Exit code %s for batch %s', exit_code, action)
+        if exit_code == 124:
+            raise Exception(f'Error {action}.\nBatch did not finish in {timeout}s')
+
+        if exit_code != 0:
+            raise Exception(f'Error {action}.\n{stderr}')
+
+        results = self.__parse_batch_output(stdout)
+        succeeded = []
+        failed = {}
+        for prepid in prepids:
+            result = results.get(prepid)
+            if not result or result['exit_code'] is None:
+                failed[prepid] = f'Error {action} for {prepid}.\nNo result'
+            elif result['exit_code'] != 0:
+                log = '\n'.join(result['log'])
+                failed[prepid] = f'Error {action} for {prepid}.\n{log}'
+            else:
+                succeeded.append((prepid, result))
+
+        return succeeded, failed
+
+    def __generate_configs(self, prepids, executor, workspace, timeout):
+        """
+        Send workspace to a remote machine and generate cmsDriver config files
+        in the same round trip
+        Return list of prepids of RelVals that had their configs generated
+        and error messages of RelVals that failed
+        """
+        results, failed = self.__run_batch_script(prepids,
+                                                  executor,
+                                                  workspace,
+                                                  './config_generate.sh',
+                                                  'generating configs',
+                                                  timeout,
+                                                  True)
+        return [prepid for prepid, _ in results], failed
+
+    def __upload_configs(self, prepids, executor, remote_directory, timeout):
+        """
+        SSH to a remote machine, upload cmsDriver config files to ReqMgr2 and
+        remove remote directory in the same round trip
+        Upload is not repeated, because a repeated upload would create duplicate
+        config documents or find the directory already removed
+        Return list of prepids of RelVals with their config names and hashes
+        and error messages of RelVals that failed
+        """
+        results, failed = self.__run_batch_script(prepids,
+                                                  executor,
+                                                  RemoteJob(remote_directory),
+                                                  './config_upload.sh',
+                                                  'uploading configs',
+                                                  timeout,
+                                                  False)
+        return [(prepid, result['hashes']) for prepid, result in results], failed
+
+    def __update_steps_with_config_hashes(self, relval, config_hashes, cached_configs):
+        """
+        Iterate through RelVal steps and set config_id values
+        Config ids of steps that were found in config cache are reused
+        """
+        for step in relval.get('steps'):
+            step_config_name = step.get_config_file_name()
+            if not step_config_name:
+                continue
+
+            step_name = step.get('name')
+            if step_config_name in cached_configs:
+                config_hash = cached_configs[step_config_name]
+                step.set('config_id', config_hash)
+                self.logger.debug('Set cached %s %s for %s',
+                                  step_config_name,
+                                  config_hash,
+                                  step_name)
+                continue
+
+            for config_pair in config_hashes:
+                config_name, config_hash = config_pair
+                if step_config_name == config_name:
+                    step.set('config_id', config_hash)
+                    config_hashes.remove(config_pair)
+                    self.logger.debug('Set %s %s for %s',
+                                      config_name,
+                                      config_hash,
+                                      step_name)
+                    break
+            else:
+                raise Exception(f'Could not find hash for {step_name}')
+
+        if config_hashes:
+            raise Exception(f'Unused hashes: {config_hashes}')
+
+        for step in relval.get('steps'):
+            step_config_name = step.get_config_file_name()
+            if not step_config_name:
+                continue
+
+            if not step.get('config_id'):
+                step_name = step.get('name')
+                raise Exception(f'Missing hash for step {step_name}')
+
+    def __get_cached_configs(self, batch_key, relvals):
+        """
+        Return cached config ids of steps of each RelVal and record cache hit ratio
+        """
+        config_cache = ConfigCache()
+        cached_configs = {}
+        hits = 0
+        misses = 0
+        for relval in relvals:
+            relval_cached_configs = config_cache.get_cached_configs(relval)
+            cached_configs[relval.get_prepid()] = relval_cached_configs
+            configs = [s for s in relval.get('steps') if s.get_config_file_name()]
+            hits += len(relval_cached_configs)
+            misses += len(configs) - len(relval_cached_configs)
+
+        config_cache.record(batch_key, hits, misses)
+        return cached_configs
+
+    @staticmethod
+    def __all_configs_cached(relval, cached_configs):
+        """
+        Return whether configs of all RelVal's steps are in given cached configs
+        """
+        for step in relval.get('steps'):
+            config_name = step.get_config_file_name()
+            if config_name and config_name not in cached_configs:
+                return False
+
+        return True
+
+    def __submit_cached(self, relvals, controller, cmssw_release, cached_configs):
+        """
+        Pass RelVals whose configs are all in config cache directly to submit stage
+        Return list of RelVals that need their configs generated
+        """
+        remaining = []
+        submit = {}
+        for relval in relvals:
+            prepid = relval.get_prepid()
+            if not self.__all_configs_cached(relval, cached_configs[prepid]):
+                remaining.append(relval)
+                continue
+
+            self.logger.info('All configs of %s are cached, skipping generation', prepid)
+            submit[prepid] = {'config_hashes': [], 'cached_configs': cached_configs[prepid]}
+
+        if submit:
+            self.submitter.get_stage('submit').put(
+                *self.submitter.get_submit_batch(controller, cmssw_release, submit))
+
+        return remaining
+
+    def __resume_submitted(self, relvals, controller, cmssw_release):
+        """
+        Pass RelVals whose workflow from a failed submission is still active in
+        ReqMgr2 directly to submit stage, so the workflow is reused
+        Return list of RelVals that need to be submitted
+        """
+        remaining = []
+        resumable = []
+        for relval in relvals:
+            if relval.get('submission_checkpoint').get('workflow_name'):
+                resumable.append(relval)
+            else:
+                remaining.append(relval)
+
+        if not resumable:
+            return remaining
+
+        workflow_names = [r.get('submission_checkpoint')['workflow_name'] for r in resumable]
+        try:
+            statuses = ReqMgrClient().get_statuses(workflow_names)
+        except Exception as ex:
+            # Workflows might be active, so RelVals must not be submitted again
+            self.logger.warning('Could not get status of %s: %s', ', '.join(workflow_names), ex)
+            prepids = self.submitter.drop_cancelled(controller, [r.get_prepid() for r in resumable])
+            self.submitter.fail(controller,
+                                prepids,
+                                f'Could not get status of workflow of previous submission: {ex}')
+            return remaining
+
+        submit = {}
+        for relval, workflow_name in zip(resumable, workflow_names):
+            prepid = relval.get_prepid()
+            workflow_status = statuses.get(workflow_name)
+            if workflow_status is None or workflow_status in ReqMgrClient.inactive_statuses:
+                self.logger.info('%s of %s is %s, it will not be reused',
+                                 workflow_name,
+                                 prepid,
+                                 workflow_status)
+                remaining.append(relval)
+                continue
+
+            self.logger.info('Reusing %s of %s', workflow_name, prepid)
+            submit[prepid] = {'workflow_name': workflow_name}
+
+        if submit:
+            self.submitter.get_stage('submit').put(
+                *self.submitter.get_submit_batch(controller, cmssw_release, submit))
+
+        return remaining
+
+    def remove_remote_directory(self, remote_directory, remote_host=None):
+        """
+        Remove remote directory of a batch that is not passed to upload stage
+        Errors are only logged, leftover directory does not affect submission
+        """
+        try:
+            with self.__borrow_executor(remote_host) as executor:
+                executor.execute_command([f'rm -rf {remote_directory}'], retry=True)
+        except Exception as ex:
+            self.logger.warning('Could not remove %s on %s: %s', remote_directory, remote_host, ex)
+
+    def generate_stage(self, item):
+        """
+        First stage of submission: take a batch of RelVals of a campaign,
+        prepare remote workspace and generate configs
+        RelVals whose previous workflow or all configs can be reused skip generation
+        """
+        batch_key = item['batch_key']
+        controller = item['controller']
+        prepids = self.submitter.take_batch(batch_key, controller)
+        # Make RelVals of the job visible for cancellation
+        item['prepids'] = prepids
+        prepids = self.submitter.drop_cancelled(controller, prepids)
+        self.logger.info('Submitting batch %s: %s', batch_key, ', '.join(prepids))
+        relvals = []
+        for prepid in prepids:
+            self.logger.debug('Will try to acquire lock for %s', prepid)
+            with Locker().get_lock(prepid):
+                relval = controller.get(prepid)
+                try:
+                    self.__check_for_submission(relval)
+                    relvals.append(relval)
+                except Exception as ex:
+                    self.submitter.handle_error(relval, str(ex))
+
+        if not relvals:
+            return []
+
+        prepids = [relval.get_prepid() for relval in relvals]
+        cmssw_release = relvals[0].get('cmssw_release')
+        try:
+            relvals = self.__resume_submitted(relvals, controller, cmssw_release)
+            if not relvals:
+                return []
+
+            prepids = [relval.get_prepid() for relval in relvals]
+            cached_configs = self.__get_cached_configs(batch_key, relvals)
+        except Exception as ex:
+            prepids = self.submitter.drop_cancelled(controller, prepids)
+            self.submitter.fail(controller, prepids, str(ex))
+            return []
+
+        relvals = self.__submit_cached(relvals, controller, cmssw_release, cached_configs)
+        if not relvals:
+            return []
+
+        return self.__generate_batch(batch_key, controller, relvals, cached_configs)
+
+    def __generate_batch(self, batch_key, controller, relvals, cached_configs):
+        """
+        Prepare remote workspace of RelVals of a batch and generate their configs
+        Return upload stage item of RelVals that had their configs generated
+        """
+        prepids = [relval.get_prepid() for relval in relvals]
+        cmssw_release = relvals[0].get('cmssw_release')
+        remote_directory = Config.get('remote_path').rstrip('/')
+        remote_directory = f'{remote_directory}/{batch_key}-{int(time.time() * 1000)}'
+        timeout = self.submitter.get_stage('generate').timeout
+        metrics = SubmissionMetrics()
+        remote_host = None
+        try:
+            with metrics.measure('prepare_workspace', cmssw_release, prepids):
+                workspace = self.__prepare_workspace(relvals,
+                                                     controller,
+                                                     remote_directory,
+                                                     cached_configs)
+
+            with self.__borrow_executor() as executor:
+                remote_host = executor.host
+                with metrics.measure('voms_proxy_init', cmssw_release, prepids):
+                    VOMSProxy().ensure(executor, timeout)
+
+                # Send workspace and create configs
+                with metrics.measure('generate_configs', cmssw_release, prepids):
+                    prepids, failed = self.__generate_configs(prepids,
+                                                              executor,
+                                                              workspace,
+                                                              timeout)
+        except Exception as ex:
+            # Shared part of the batch failed, so all RelVals in it failed
+            prepids = self.submitter.drop_cancelled(controller, prepids)
+            self.submitter.fail(controller, prepids, str(ex))
+            if remote_host:
+                self.remove_remote_directory(remote_directory, remote_host)
+
+            return []
+
+        for prepid in self.submitter.drop_cancelled(controller, list(failed)):
+            self.submitter.fail(controller, [prepid], failed[prepid])
+
+        prepids = self.submitter.drop_cancelled(controller, prepids)
+        if not prepids:
+            self.remove_remote_directory(remote_directory, remote_host)
+            return []
+
+        submission_queue = SubmissionQueue()
+        for prepid in prepids:
+            submission_queue.set_stage(prepid, 'upload', {'remote_directory': remote_directory,
+                                                          'remote_host': remote_host})
+
+        return [(batch_key, {'controller': controller,
+                             'cmssw_release': cmssw_release,
+                             'remote_directory': remote_directory,
+                             'remote_host': remote_host,
+                             'prepids': prepids,
+                             'cached_configs': cached_configs})]
+
+    def speculate_stage(self, item):
+        """
+        Speculative stage: generate and upload configs of approved RelVals before
+        they are submitted and save their config ids in the config cache
+        Cache keys depend on step contents, so configs of RelVals that change
+        afterwards will not be used
+        """
+        batch_key = item['batch_key']
+        controller = item['controller']
+        config_cache = ConfigCache()
+        relvals = []
+        cached_configs = {}
+        for prepid in item['prepids']:
+            relval = controller.get(prepid)
+            if relval.get('status') != 'approved':
+                continue
+
+            relval_cached_configs = config_cache.get_cached_configs(relval)
+            if not self.__all_configs_cached(relval, relval_cached_configs):
+                relvals.append(relval)
+                cached_configs[prepid] = relval_cached_configs
+
+        if not relvals:
+            return []
+
+        prepids = [relval.get_prepid() for relval in relvals]
+        self.logger.info('Speculatively generating configs of %s', ', '.join(prepids))
+        cmssw_release = relvals[0].get('cmssw_release')
+        remote_directory = Config.get('remote_path').rstrip('/')
+        remote_directory = f'{remote_directory}/speculative-{batch_key}-{int(time.time() * 1000)}'
+        generate_timeout = self.submitter.get_stage('generate').timeout
+        upload_timeout = self.submitter.get_stage('upload').timeout
+        metrics = SubmissionMetrics()
+        uploaded = []
+        try:
+            with self.__borrow_executor() as executor:
+                try:
+                    with metrics.measure('speculative_generate', cmssw_release, prepids):
+                        workspace = self.__prepare_workspace(relvals,
+                                                             controller,
+                                                             remote_directory,
+                                                             cached_configs)
+                        VOMSProxy().ensure(executor, generate_timeout)
+                        generated, failed = self.__generate_configs(prepids,
+                                                                    executor,
+                                                                    workspace,
+                                                                    generate_timeout)
+
+                    if generated:
+                        # Upload job removes remote directory
+                        with metrics.measure('speculative_upload', cmssw_release, generated):
+                            uploaded, upload_failed = self.__upload_configs(generated,
+                                                                            executor,
+                                                                            remote_directory,
+                                                                            upload_timeout)
+
+                        failed.update(upload_failed)
+                    else:
+                        executor.execute_command([f'rm -rf {remote_directory}'], retry=True)
+                except Exception:
+                    executor.execute_command([f'rm -rf {remote_directory}'], retry=True)
+                    raise
+        except Exception as ex:
+            self.logger.error('Speculative config generation of %s failed: %s', batch_key, ex)
+            return []
+
+        for prepid, error_message in failed.items():
+            self.logger.warning('Speculative config generation failed: %s', error_message)
+
+        relvals = {relval.get_prepid(): relval for relval in relvals}
+        for prepid, config_hashes in uploaded:
+            relval = relvals[prepid]
+            try:
+                # Steps are updated only in memory to get config ids for the cache
+                self.__update_steps_with_config_hashes(relval,
+                                                       list(config_hashes),
+                                                       cached_configs[prepid])
+                config_cache.save_configs(relval, cached_configs[prepid])
+                self.logger.info('Saved speculative configs of %s', prepid)
+            except Exception as ex:
+                self.logger.error('Could not save speculative configs of %s: %s', prepid, ex)
+
+        return []
+
+    def upload_stage(self, batch):
+        """
+        Second stage of submission: upload generated configs of a batch
+        and remove remote workspace
+        """
+        controller = batch['controller']
+        prepids = batch['prepids']
+        remote_directory = batch['remote_directory']
+        cached_configs = batch['cached_configs']
+        cmssw_release = batch['cmssw_release']
+        timeout = self.submitter.get_stage('upload').timeout
+        prepids = self.submitter.drop_cancelled(controller, prepids)
+        try:
+            # Configs are uploaded from the same host where they were generated
+            with self.__borrow_executor(batch['remote_host']) as executor:
+                uploaded = []
+                failed = {}
+                if prepids:
+                    # Proxy might have expired while configs were generated
+                    with SubmissionMetrics().measure('voms_proxy_init', cmssw_release, prepids):
+                        VOMSProxy().ensure(executor, timeout)
+
+                    # Upload job removes remote directory
+                    with SubmissionMetrics().measure('upload_configs', cmssw_release, prepids):
+                        uploaded, failed = self.__upload_configs(prepids,
+                                                                 executor,
+                                                                 remote_directory,
+                                                                 timeout)
+                else:
+                    executor.execute_command([f'rm -rf {remote_directory}'], retry=True)
+        except Exception as ex:
+            prepids = self.submitter.drop_cancelled(controller, prepids)
+            self.submitter.fail(controller, prepids, str(ex))
+            return []
+
+        for prepid in self.submitter.drop_cancelled(controller, list(failed)):
+            self.submitter.fail(controller, [prepid], failed[prepid])
+
+        not_cancelled = self.submitter.drop_cancelled(controller,
+                                                      [prepid for prepid, _ in uploaded])
+        uploaded = [(prepid, hashes) for prepid, hashes in uploaded if prepid in not_cancelled]
+        if not uploaded:
+            return []
+
+        submit = {prepid: {'config_hashes': config_hashes,
+                           'cached_configs': cached_configs.get(prepid, {})}
+                  for prepid, config_hashes in uploaded}
+        return [self.submitter.get_submit_batch(controller, cmssw_release, submit)]
+
+    def submit_stage(self, item):
+        """
+        Third stage of submission: set config hashes of a batch of RelVals and
+        submit their workflows to ReqMgr2 concurrently
+        RelVals are not locked while they are being submitted, so a cancelled job
+        does not keep them locked
+        """
+        controller = item['controller']
+        cmssw_release = item.get('cmssw_release', '')
+        workflows = {}
+        job_dicts = {}
+        for prepid in list(item['prepids']):
+            with Locker().get_lock(prepid):
+                relval = controller.get(prepid)
+                if self.submitter.is_cancelled(prepid):
+                    self.submitter.handle_error(relval, 'Submission was cancelled')
+                    continue
+
+                try:
+                    workflow_name = self.__prepare_submission(relval, item['relvals'][prepid])
+                    if workflow_name:
+                        workflows[prepid] = workflow_name
+                    else:
+                        job_dicts[prepid] = controller.get_job_dict(relval)
+                except Exception as ex:
+                    self.submitter.handle_error(relval, str(ex))
+
+        if job_dicts:
+            # Submit job dicts to ReqMgr2
+            with SubmissionMetrics().measure('reqmgr_submit', cmssw_release, list(job_dicts)):
+                timeout = self.submitter.get_stage('submit').timeout
+                deadline = time.time() + timeout if timeout else None
+                results = ReqMgrClient().submit_many(job_dicts, deadline)
+
+            for prepid, (workflow_name, error) in results.items():
+                with Locker().get_lock(prepid):
+                    relval = controller.get(prepid)
+                    try:
+                        if error:
+                            raise Exception(error)
+
+                        relval.set('workflows', [{'name': workflow_name}])
+                        if self.submitter.is_cancelled(prepid):
+                            # Workflow is remembered, so it is reused or rejected later
+                            raise Exception('Submission was cancelled')
+
+                        self.__set_submitted(relval, workflow_name)
+                        workflows[prepid] = workflow_name
+                    except Exception as ex:
+                        self.submitter.handle_error(relval, str(ex))
+
+        if not workflows:
+            return []
+
+        submission_queue = SubmissionQueue()
+        for prepid, workflow_name in workflows.items():
+            data = {'cmssw_release': cmssw_release, 'workflow_name': workflow_name}
+            submission_queue.set_stage(prepid, 'approve', data)
+
+        prepids = list(workflows)
+        return [(self.submitter.get_job_name(prepids), {'controller': controller,
+                                                'cmssw_release': cmssw_release,
+                                                'prepids': prepids,
+                                                'workflows': workflows,
+                                                'attempt': 0})]
+
+    def __prepare_submission(self, relval, data):
+        """
+        Set and save config hashes of a locked RelVal before it's submission
+        Return name of workflow if RelVal already has one and does not need to be
+        submitted
+        """
+        prepid = relval.get_prepid()
+        if relval.get('status') == 'submitted' and relval.get('workflows'):
+            # RelVal was submitted before submission was interrupted
+            workflow_name = relval.get('workflows')[-1]['name']
+            self.logger.info('%s is already submitted as %s', prepid, workflow_name)
+            return workflow_name
+
+        self.__check_for_submission(relval)
+        if data.get('workflow_name'):
+            # Workflow of a failed submission is reused
+            workflow_name = data['workflow_name']
+            relval.set('workflows', [{'name': workflow_name}])
+            relval.set('status', 'submitted')
+            relval.add_history('submission', 'resumed', 'automatic')
+            Database('relvals').save(relval.get_json())
+            return workflow_name
+
+        # Iterate through uploaded configs and save their hashes in RelVal steps
+        cached_configs = data['cached_configs']
+        self.__update_steps_with_config_hashes(relval, data['config_hashes'], cached_configs)
+        ConfigCache().save_configs(relval, cached_configs)
+        Database('relvals').save(relval.get_json())
+        return None
+
+    @staticmethod
+    def __set_submitted(relval, workflow_name):
+        """
+        Save workflow name of a successfully submitted RelVal
+        """
+        checkpoint = relval.get('submission_checkpoint')
+        checkpoint['workflow_name'] = workflow_name
+        relval.set('submission_checkpoint', checkpoint)
+        relval.set('workflows', [{'name': workflow_name}])
+        relval.set('status', 'submitted')
+        relval.add_history('submission', 'succeeded', 'automatic')
+        Database('relvals').save(relval.get_json())
+
+    def approve_stage(self, item):
+        """
+        Fourth stage of submission: approve a batch of workflows as soon as they
+        are visible in ReqMgr2
+        Workflows that are not visible yet are checked again later with exponential
+        backoff, RelVals whose workflows were rejected, aborted or failed fail
+        """
+        controller = item['controller']
+        cmssw_release = item.get('cmssw_release', '')
+        prepids = self.submitter.drop_cancelled(controller, list(item['prepids']))
+        if not prepids:
+            return []
+
+        workflows = {prepid: item['workflows'][prepid] for prepid in prepids}
+        metrics = SubmissionMetrics()
+        client = ReqMgrClient()
+        timeout = self.submitter.get_stage('approve').timeout
+        deadline = time.time() + timeout if timeout else None
+        try:
+            with metrics.measure('reqmgr_status', cmssw_release, prepids):
+                statuses = client.get_statuses(list(workflows.values()), deadline)
+        except Exception as ex:
+            self.submitter.fail(controller, prepids, str(ex))
+            return []
+
+        missing = [prepid for prepid in prepids if statuses[workflows[prepid]] is None]
+        if missing:
+            self.__approve_later(item, missing)
+
+        new = [workflows[prepid] for prepid in prepids if statuses[workflows[prepid]] == 'new']
+        errors = {}
+        if new:
+            self.logger.debug('Approving %s', ', '.join(new))
+            approved = [prepid for prepid in prepids if workflows[prepid] in new]
+            with metrics.measure('reqmgr_approve', cmssw_release, approved):
+                errors = client.approve_many(new, deadline)
+
+        results = []
+        submission_queue = SubmissionQueue()
+        for prepid in prepids:
+            workflow_name = workflows[prepid]
+            if prepid in missing:
+                continue
+
+            if workflow_name in errors:
+                self.submitter.fail(controller, [prepid], errors[workflow_name])
+                continue
+
+            workflow_status = statuses[workflow_name]
+            if workflow_status in ReqMgrClient.inactive_statuses:
+                self.submitter.fail(controller, [prepid], f'{workflow_name} is {workflow_status}')
+                continue
+
+            data = {'cmssw_release': cmssw_release, 'workflow_name': workflow_name}
+            submission_queue.set_stage(prepid, 'stats', data)
+            results.append((prepid, dict(data, controller=controller, prepids=[prepid])))
+
+        return results
+
+    def __approve_later(self, item, prepids):
+        """
+        Put RelVals whose workflows are not visible in ReqMgr2 yet back to approve
+        stage after a delay or fail them if they ran out of attempts
+        """
+        controller = item['controller']
+        attempt = item['attempt'] + 1
+        max_attempts = int(Config.get('submission_approve_attempts') or 10)
+        if attempt >= max_attempts:
+            for prepid in prepids:
+                workflow_name = item['workflows'][prepid]
+                self.submitter.fail(controller,
+                                    [prepid],
+                                    f'{workflow_name} did not appear in ReqMgr2 '
+                                    f'after {max_attempts} attempts')
+
+            return
+
+        delay = float(Config.get('submission_approve_delay') or 1)
+        max_delay = float(Config.get('submission_approve_max_delay') or 60)
+        delay = min(delay * 2 ** (attempt - 1), max_delay)
+        later = {'controller': controller,
+                 'cmssw_release': item.get('cmssw_release', ''),
+                 'prepids': prepids,
+                 'workflows': {prepid: item['workflows'][prepid] for prepid in prepids},
+                 'attempt': attempt}
+        job_name = self.submitter.get_job_name(prepids)
+        self.submitter.get_stage('approve').put_later(job_name, later, delay)
+
+    def stats_stage(self, item):
+        """
+        Last stage of submission: make Stats2 pick up the new workflow and
+        update RelVal with workflow information
+        """
+        controller = item['controller']
+        prepid = item['prepids'][0]
+        cmssw_release = item.get('cmssw_release', '')
+        metrics = SubmissionMetrics()
+        if not self.submitter.drop_cancelled(controller, [prepid]):
+            return []
+
+        # RelVal is not locked during the request, so a cancelled job does not keep it locked
+        try:
+            with metrics.measure('stats_refresh', cmssw_release, [prepid]):
+                controller.force_stats_to_refresh([item['workflow_name']],
+                                                  self.submitter.get_stage('stats').timeout)
+        except Exception as ex:
+            # Workflow is already submitted and approved, so submission succeeded
+            # and Stats2 will pick the workflow up on it's own later
+            self.logger.warning('Could not refresh %s in Stats2: %s',
+                                item['workflow_name'],
+                                ex)
+
+        with Locker().get_lock(prepid):
+            relval = controller.get(prepid)
+            if self.submitter.is_cancelled(prepid):
+                self.submitter.handle_error(relval, 'Submission was cancelled')
+                return []
+
+            self.submitter.handle_success(relval)
+            self.submitter.remove_from_queue(prepid)
+
+        with metrics.measure('update_workflows', cmssw_release, [prepid]):
+            controller.update_workflows(relval)
+
+        self.logger.info('Successfully finished %s submission', prepid)
+        return []
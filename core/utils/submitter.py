@@ -1,59 +1,532 @@
 """
 Module that has all classes used for request submission to computing
 """
-import os
 import time
-from core_lib.utils.ssh_executor import SSHExecutor
+from fnmatch import fnmatch
+from threading import Lock
 from core_lib.utils.locker import Locker
+from core_lib.utils.user_info import UserInfo
 from core_lib.database.database import Database
-from core_lib.utils.connection_wrapper import ConnectionWrapper
 from core_lib.utils.submitter import Submitter as BaseSubmitter
 from core_lib.utils.common_utils import clean_split
 from core_lib.utils.global_config import Config
 from core.utils.emailer import Emailer
+from core.utils.notifier import Notifier
+from core.utils.submission_stage import SubmissionStage
+from core.utils.fair_share_queue import FairShareQueue
+from core.utils.worker_autoscaler import WorkerAutoscaler
+from core.utils.submission_queue import SubmissionQueue
+from core.utils.submission_stages import SubmissionStages
 
 
 class RequestSubmitter(BaseSubmitter):
     """
     Subclass of base submitter that is tailored for RelVal submission
+    RelVals of the same campaign (CMSSW release and batch name) are submitted
+    in batches that share one remote workspace
+    Submission is split into stages - config generation, config upload,
+    ReqMgr2 submission, workflow approval and Stats2 sync, each with it's own workers
+    Each stage takes items with higher priority first and takes turns between users
+    and campaigns within the same priority
+    Functions of the stages are in SubmissionStages
     """
 
-    def add(self, relval, relval_controller):
+    # Prepids of RelVals that are waiting to be submitted, grouped by campaign
+    __pending = {}
+    # Prepids of RelVals in the submission queue to their priority, user and campaign
+    __schedule = {}
+    # Time when last RelVal was added to each campaign
+    __last_added = {}
+    # Campaigns that already have a task in the submission queue
+    __scheduled = set()
+    __pending_lock = Lock()
+    # Names of submission pipeline stages to stages
+    __stages = {}
+    __stages_lock = Lock()
+    # Prepids of RelVals whose submission was cancelled while it was running
+    __cancelled = set()
+    __cancelled_lock = Lock()
+
+    @staticmethod
+    def get_batch_key(relval):
+        """
+        Return a key that RelVals are grouped by - campaign of a RelVal
+        """
+        cmssw_release = relval.get('cmssw_release')
+        batch_name = relval.get('batch_name')
+        return f'{cmssw_release}__{batch_name}'
+
+    def __get_stages(self):
+        """
+        Return dictionary of submission pipeline stages, create them if they do not exist
+        """
+        with RequestSubmitter.__stages_lock:
+            if not RequestSubmitter.__stages:
+                stage_functions = SubmissionStages(self)
+                queue_size = int(Config.get('submission_stage_queue_size') or 100)
+                stages = []
+                for name, function, workers, timeout in (
+                        ('generate', stage_functions.generate_stage, 2, 3600),
+                        ('upload', stage_functions.upload_stage, 2, 1800),
+                        ('submit', stage_functions.submit_stage, 4, 300),
+                        ('approve', stage_functions.approve_stage, 2, 300),
+                        ('stats', stage_functions.stats_stage, 2, 600)):
+                    workers = int(Config.get(f'submission_{name}_workers') or workers)
+                    timeout = int(Config.get(f'submission_{name}_timeout') or timeout)
+                    # Generate stage queue has only one item per campaign
+                    stage_queue_size = 0 if name == 'generate' else queue_size
+                    stages.append(SubmissionStage(name,
+                                                  function,
+                                                  workers,
+                                                  stage_queue_size,
+                                                  timeout,
+                                                  self.__get_schedule_key))
+
+                for stage, next_stage in zip(stages, stages[1:]):
+                    stage.next_stage = next_stage
+
+                # Speculative config generation is not a part of the pipeline
+                workers = int(Config.get('submission_speculate_workers') or 1)
+                stages.append(SubmissionStage('speculate',
+                                              stage_functions.speculate_stage,
+                                              workers,
+                                              0,
+                                              stages[0].timeout + stages[1].timeout,
+                                              self.__get_schedule_key))
+                RequestSubmitter.__stages.update((stage.name, stage) for stage in stages)
+                # Number of workers of each stage is adjusted to the load
+                WorkerAutoscaler().start(stages, ('generate', 'upload', 'speculate'))
+
+            return RequestSubmitter.__stages
+
+    def get_stage(self, name):
+        """
+        Return submission pipeline stage with given name
+        """
+        stage = self.__get_stages().get(name)
+        if stage is None:
+            raise Exception(f'Stage {name} does not exist')
+
+        return stage
+
+    def get_priority(self, batch_key, role, priority=None):
+        """
+        Return submission priority of a RelVal
+        Given priority is used as is, otherwise priority is the sum of priority of the
+        first matching campaign pattern in "submission_campaign_priorities" and
+        priority of the role in "submission_role_priorities"
+        """
+        if priority is not None:
+            return int(priority)
+
+        campaign_priority = self.__get_config_priority('submission_campaign_priorities',
+                                                       lambda x: fnmatch(batch_key, x))
+        role_priority = self.__get_config_priority('submission_role_priorities',
+                                                   lambda x: x == role)
+        return campaign_priority + role_priority
+
+    def __get_config_priority(self, config_name, matches):
+        """
+        Return priority of the first matching entry of a comma separated list of
+        "name:priority" in config or 0 if no entry matches
+        Malformed entries are skipped, so they do not fail RelVals that are being submitted
+        """
+        for entry in clean_split(Config.get(config_name) or '', ','):
+            try:
+                name, value = entry.rsplit(':', 1)
+                value = int(value)
+            except ValueError:
+                self.logger.warning('Skipping malformed entry "%s" in %s', entry, config_name)
+                continue
+
+            if matches(name.strip()):
+                return value
+
+        return 0
+
+    def add(self, relval, relval_controller, priority=None):
         """
         Add a RelVal to the submission queue
+        RelVal is added to a batch of it's campaign
+        RelVals that are already in the queue are not added again
+        If priority is not given, it is derived from campaign and user's role
         """
         prepid = relval.get_prepid()
-        super().add_task(prepid,
-                         self.submit_relval,
-                         relval=relval,
-                         controller=relval_controller)
+        batch_key = self.get_batch_key(relval)
+        user_info = UserInfo().get_user_info()
+        user = user_info.get('username', '')
+        priority = self.get_priority(batch_key, user_info.get('role', ''), priority)
+        if SubmissionQueue().add(prepid, batch_key, priority, user):
+            self.logger.info('Adding %s to submission queue with priority %s', prepid, priority)
+            self.__set_schedule(prepid, batch_key, priority, user)
+            self.__add_pending(prepid, batch_key, relval_controller)
+
+    @staticmethod
+    def __set_schedule(prepid, batch_key, priority, user):
+        """
+        Remember priority, user and campaign of a RelVal for scheduling of stage items
+        """
+        with RequestSubmitter.__pending_lock:
+            RequestSubmitter.__schedule[prepid] = {'priority': priority,
+                                                   'user': user,
+                                                   'batch_key': batch_key}
+
+    @staticmethod
+    def remove_from_queue(prepid):
+        """
+        Remove a RelVal from the submission queue
+        """
+        SubmissionQueue().remove(prepid)
+        with RequestSubmitter.__pending_lock:
+            RequestSubmitter.__schedule.pop(prepid, None)
+
+    @staticmethod
+    def __get_schedule_key(item):
+        """
+        Return priority, user and campaign of a stage item
+        Item gets the highest priority of it's RelVals and user and campaign of the
+        first RelVal with that priority
+        Items of campaigns that were not taken yet get priority of pending RelVals
+        """
+        with RequestSubmitter.__pending_lock:
+            prepids = item.get('prepids')
+            if prepids is None:
+                prepids = RequestSubmitter.__pending.get(item.get('batch_key'), [])
+
+            entries = [RequestSubmitter.__schedule[p]
+                       for p in prepids if p in RequestSubmitter.__schedule]
+
+        if not entries:
+            return 0, '', item.get('batch_key', '')
+
+        entry = max(entries, key=lambda x: x['priority'])
+        return entry['priority'], entry['user'], entry['batch_key']
+
+    @staticmethod
+    def __get_pending_schedule(pending):
+        """
+        Return copy of priorities and users of given pending prepids
+        Must be called with pending lock held
+        """
+        schedule = RequestSubmitter.__schedule
+        return {prepid: schedule[prepid] for prepid in pending if prepid in schedule}
+
+    @staticmethod
+    def __order_pending(pending, schedule):
+        """
+        Return pending prepids of a campaign in the order they will be taken
+        Schedule is a copy made by __get_pending_schedule, so ordering, which is slow
+        for large campaigns, does not need pending lock
+        """
+        default = {'priority': 0, 'user': '', 'batch_key': ''}
+        return FairShareQueue.order(pending,
+                                    lambda p: (schedule.get(p, default)['priority'],
+                                               schedule.get(p, default)['user'],
+                                               ''))
+
+    def __add_pending(self, prepid, batch_key, controller):
+        """
+        Add a RelVal to the pending batch of it's campaign and schedule the batch
+        """
+        with RequestSubmitter.__pending_lock:
+            pending = RequestSubmitter.__pending.setdefault(batch_key, [])
+            if prepid not in pending:
+                pending.append(prepid)
+
+            RequestSubmitter.__last_added[batch_key] = time.time()
+            if batch_key in RequestSubmitter.__scheduled:
+                self.logger.debug('Added %s to already scheduled batch %s', prepid, batch_key)
+                return
+
+            RequestSubmitter.__scheduled.add(batch_key)
+
+        self.get_stage('generate').put(batch_key, {'batch_key': batch_key,
+                                                     'controller': controller})
+
+    def resume(self, controller):
+        """
+        Resume submission of RelVals that were in the submission queue
+        when the service was stopped
+        RelVals that did not have their configs uploaded start from the beginning and
+        remote directories of their generated configs are removed
+        RelVals of the same release in submit and approve stages are resumed in batches
+        """
+        submission_queue = SubmissionQueue()
+        # Release to dictionary of prepids and their data
+        submit = {}
+        approve = {}
+        # Remote directories of generated configs and their hosts
+        remote_directories = {}
+        for entry in submission_queue.get_all():
+            prepid = entry['prepid']
+            stage = entry['stage']
+            data = dict(entry.get('data', {}))
+            self.logger.info('Resuming %s submission at %s stage', prepid, stage)
+            self.__set_schedule(prepid,
+                                entry['batch_key'],
+                                entry.get('priority', 0),
+                                entry.get('user', ''))
+            cmssw_release = data.pop('cmssw_release', '')
+            if stage == 'submit':
+                submit.setdefault(cmssw_release, {})[prepid] = data
+            elif stage == 'approve':
+                approve.setdefault(cmssw_release, {})[prepid] = data['workflow_name']
+            elif stage == 'stats':
+                item = dict(data, cmssw_release=cmssw_release)
+                item.update({'controller': controller, 'prepids': [prepid]})
+                self.get_stage(stage).put(prepid, item)
+            else:
+                if stage == 'upload' and data.get('remote_directory'):
+                    remote_directories[data['remote_directory']] = data.get('remote_host')
+
+                submission_queue.set_stage(prepid, 'pending')
+                self.__add_pending(prepid, entry['batch_key'], controller)
+
+        stage_functions = SubmissionStages(self)
+        for remote_directory, remote_host in remote_directories.items():
+            stage_functions.remove_remote_directory(remote_directory, remote_host)
+
+        for cmssw_release, relvals in submit.items():
+            self.get_stage('submit').put(*self.get_submit_batch(controller,
+                                                                    cmssw_release,
+                                                                    relvals))
+
+        for cmssw_release, workflows in approve.items():
+            prepids = list(workflows)
+            self.get_stage('approve').put(self.get_job_name(prepids),
+                                            {'controller': controller,
+                                             'cmssw_release': cmssw_release,
+                                             'prepids': prepids,
+                                             'workflows': workflows,
+                                             'attempt': 0})
+
+    def get_names_in_queue(self):
+        """
+        Return prepids, stages, priorities and users of all RelVals in the submission queue
+        RelVals that wait for their batch to start also have their position and
+        estimated start time
+        """
+        estimates = self.__get_pending_estimates()
+        queue = []
+        for entry in SubmissionQueue().get_all():
+            prepid = entry['prepid']
+            position, estimated_start = estimates.get(prepid, (None, None))
+            queue.append({'prepid': prepid,
+                          'stage': entry['stage'],
+                          'added': entry['added'],
+                          'priority': entry.get('priority', 0),
+                          'user': entry.get('user', ''),
+                          'position': position,
+                          'estimated_start': estimated_start})
+
+        return queue
+
+    def __get_pending_estimates(self):
+        """
+        Return dictionary of prepids of pending RelVals and tuples of their position and
+        estimated start time
+        Campaigns take turns, so each next batch of a campaign waits for a batch of every
+        other queued campaign, start time is based on mean duration of generate stage jobs
+        """
+        stage = self.get_stage('generate')
+        campaigns = []
+        for item in stage.get_queued_items():
+            if item['batch_key'] not in campaigns:
+                campaigns.append(item['batch_key'])
+
+        batch_size = int(Config.get('submission_batch_size') or 50)
+        with RequestSubmitter.__pending_lock:
+            pending = {batch_key: list(prepids)
+                       for batch_key, prepids in RequestSubmitter.__pending.items()}
+            schedule = self.__get_pending_schedule([p for x in pending.values() for p in x])
+
+        pending = {batch_key: self.__order_pending(prepids, schedule)
+                   for batch_key, prepids in pending.items()}
 
-    def __handle_error(self, relval, error_message):
+        batches = []
+        for batch_key, prepids in pending.items():
+            # Campaign that is not in the queue is being taken by a worker
+            index = campaigns.index(batch_key) + 1 if batch_key in campaigns else 0
+            for number, prepid in enumerate(prepids):
+                batches_ahead = index + number // batch_size * max(len(campaigns), 1)
+                batches.append((batches_ahead, number, prepid))
+
+        workers = max(stage.get_status()['workers'], 1)
+        duration = stage.get_mean_duration()
+        now = int(time.time())
+        estimates = {}
+        for position, (batches_ahead, _, prepid) in enumerate(sorted(batches), 1):
+            estimated_start = None
+            if duration is not None:
+                estimated_start = now + int(batches_ahead // workers * duration)
+
+            estimates[prepid] = (position, estimated_start)
+
+        return estimates
+
+    def get_stages_status(self):
+        """
+        Return number of queued items and busy workers of each submission stage
+        """
+        return {name: stage.get_status() for name, stage in self.__get_stages().items()}
+
+    def get_worker_status(self):
+        """
+        Return status of workers of all submission stages
+        """
+        status = {}
+        for stage in self.__get_stages().values():
+            status.update(stage.get_worker_status())
+
+        return status
+
+    def speculate(self, relvals, controller):
+        """
+        Generate and upload configs of approved RelVals in the background, so
+        their submission can take configs from the config cache
+        """
+        batches = {}
+        for relval in relvals:
+            batches.setdefault(self.get_batch_key(relval), []).append(relval.get_prepid())
+
+        stage = self.get_stage('speculate')
+        for batch_key, prepids in batches.items():
+            stage.put(batch_key, {'batch_key': batch_key,
+                                  'controller': controller,
+                                  'prepids': prepids})
+
+    def cancel(self, prepid, controller):
+        """
+        Cancel submission of a RelVal that is in the submission queue
+        Queued RelVal is handled as a failed submission immediately, running RelVal
+        is handled when it's current job returns and it's worker is replaced if the
+        job has no other RelVals
+        Return "queued" or "running"
+        """
+        if not SubmissionQueue().get(prepid):
+            raise Exception(f'{prepid} is not in submission queue')
+
+        self.logger.info('Cancelling %s submission', prepid)
+        with RequestSubmitter.__cancelled_lock:
+            RequestSubmitter.__cancelled.add(prepid)
+            cancelled = set(RequestSubmitter.__cancelled)
+
+        with RequestSubmitter.__pending_lock:
+            for pending in RequestSubmitter.__pending.values():
+                if prepid in pending:
+                    pending.remove(prepid)
+
+        states = [stage.cancel(prepid, cancelled) for stage in self.__get_stages().values()]
+        if 'running' in states:
+            return 'running'
+
+        self.drop_cancelled(controller, [prepid])
+        return 'queued'
+
+    def drop_cancelled(self, controller, prepids):
+        """
+        Handle cancelled RelVals in given list as failed submissions
+        Return list of prepids that were not cancelled
+        """
+        with RequestSubmitter.__cancelled_lock:
+            cancelled = [p for p in prepids if p in RequestSubmitter.__cancelled]
+            RequestSubmitter.__cancelled.difference_update(cancelled)
+
+        if cancelled:
+            self.fail(controller, cancelled, 'Submission was cancelled')
+
+        return [p for p in prepids if p not in cancelled]
+
+    def is_cancelled(self, prepid):
+        """
+        Return whether RelVal was cancelled and forget the cancellation
+        Caller is responsible for handling RelVal as failed submission
+        """
+        with RequestSubmitter.__cancelled_lock:
+            if prepid in RequestSubmitter.__cancelled:
+                RequestSubmitter.__cancelled.remove(prepid)
+                return True
+
+        return False
+
+    def take_batch(self, batch_key, controller):
+        """
+        Wait for more RelVals of the same campaign and take up to batch size of them
+        If there are RelVals left, schedule another batch for them
+        """
+        batch_size = int(Config.get('submission_batch_size') or 50)
+        batch_wait = int(Config.get('submission_batch_wait') or 10)
+        while True:
+            with RequestSubmitter.__pending_lock:
+                pending = list(RequestSubmitter.__pending.get(batch_key, []))
+                last_added = RequestSubmitter.__last_added.get(batch_key, 0)
+                if len(pending) >= batch_size or time.time() - last_added >= batch_wait:
+                    schedule = self.__get_pending_schedule(pending)
+                    break
+
+            time.sleep(1)
+
+        # RelVals might be added or cancelled while pending RelVals are ordered
+        ordered = self.__order_pending(pending, schedule)
+        with RequestSubmitter.__pending_lock:
+            pending = RequestSubmitter.__pending.get(batch_key, [])
+            pending_set = set(pending)
+            prepids = [prepid for prepid in ordered if prepid in pending_set][:batch_size]
+            taken = set(prepids)
+            pending[:] = [prepid for prepid in pending if prepid not in taken]
+            left = len(pending)
+            if not pending:
+                RequestSubmitter.__pending.pop(batch_key, None)
+                RequestSubmitter.__last_added.pop(batch_key, None)
+                RequestSubmitter.__scheduled.discard(batch_key)
+
+        if left:
+            self.logger.info('%s RelVals of %s are left for the next batch',
+                             left,
+                             batch_key)
+            self.get_stage('generate').put(batch_key, {'batch_key': batch_key,
+                                                         'controller': controller})
+
+        submission_queue = SubmissionQueue()
+        for prepid in prepids:
+            submission_queue.set_stage(prepid, 'generate')
+
+        return prepids
+
+    def handle_error(self, relval, error_message):
         """
         Handle error that occured during submission, modify RelVal accordingly
         """
         self.logger.error(error_message)
+        self.remove_from_queue(relval.get_prepid())
         relval_db = Database('relvals')
-        relval.set('status', 'new')
+        # Resolved globaltags and config ids are kept and submitted workflow is
+        # remembered in the checkpoint, so next submission continues from the
+        # first stage that did not finish
+        checkpoint = relval.get('submission_checkpoint')
+        workflows = relval.get('workflows')
+        if workflows:
+            checkpoint['workflow_name'] = workflows[-1]['name']
+
+        relval.set('submission_checkpoint', checkpoint)
+        relval.set('workflows', [])
+        relval.set('status', 'approved')
         relval.set('campaign_timestamp', 0)
         relval.add_history('submission', 'failed', 'automatic')
-        for step in relval.get('steps'):
-            step.set('config_id', '')
-            step.set('resolved_globaltag', '')
-
         relval_db.save(relval.get_json())
         service_url = Config.get('service_url')
-        emailer = Emailer()
         prepid = relval.get_prepid()
         subject = f'RelVal {prepid} submission failed'
         body = f'Hello,\n\nUnfortunately submission of {prepid} failed.\n'
         body += (f'You can find this relval at '
                  f'{service_url}/relvals?prepid={prepid}\n')
-        body += f'Error message:\n\n{error_message}'
-        recipients = emailer.get_recipients(relval)
-        emailer.send(subject, body, recipients)
+        body += f'Error message:\n\n{error_message}\n\n'
+        body += ('RelVal was moved back to approved, stages that were completed will be '
+                 'reused when it is submitted again.')
+        recipients = Emailer().get_recipients(relval)
+        Notifier().notify(self.get_batch_key(relval), subject, body, recipients)
 
-    def __handle_success(self, relval):
+    def handle_success(self, relval):
         """
         Handle notification of successful submission
         """
@@ -62,7 +535,6 @@ class RequestSubmitter(BaseSubmitter):
         cmsweb_url = Config.get('cmsweb_url')
         self.logger.info('Submission of %s succeeded', prepid)
         service_url = Config.get('service_url')
-        emailer = Emailer()
         subject = f'RelVal {prepid} submission succeeded'
         body = f'Hello,\n\nSubmission of {prepid} succeeded.\n'
         body += (f'You can find this relval at '
@@ -72,167 +544,41 @@ class RequestSubmitter(BaseSubmitter):
             body += '\nNOTE: This was submitted from a development instance of RelVal machine '
             body += 'and this job will never start running in computing!\n'
 
-        recipients = emailer.get_recipients(relval)
-        emailer.send(subject, body, recipients)
+        recipients = Emailer().get_recipients(relval)
+        Notifier().notify(self.get_batch_key(relval), subject, body, recipients)
 
-    def __prepare_workspace(self, relval, controller, ssh_executor, remote_directory):
+    def fail(self, controller, prepids, error_message):
         """
-        Clean or create a remote directory and upload all needed files
+        Lock, reload and handle error of each RelVal in given list
         """
-        prepid = relval.get_prepid()
-        self.logger.info('Preparing workspace for %s', prepid)
-        ssh_executor.execute_command([f'rm -rf {remote_directory}',
-                                      f'mkdir -p {remote_directory}'])
-        with open(f'/tmp/{prepid}_generate.sh', 'w') as temp_file:
-            config_file_content = controller.get_cmsdriver(relval, for_submission=True)
-            temp_file.write(config_file_content)
+        for prepid in prepids:
+            with Locker().get_lock(prepid):
+                relval = controller.get(prepid)
+                self.handle_error(relval, error_message)
 
-        with open(f'/tmp/{prepid}_upload.sh', 'w') as temp_file:
-            upload_file_content = controller.get_config_upload_file(relval)
-            temp_file.write(upload_file_content)
-
-        # Upload config generation script - cmsDrivers
-        ssh_executor.upload_file(f'/tmp/{prepid}_generate.sh',
-                                 f'{remote_directory}/config_generate.sh')
-        # Upload config upload to ReqMgr2 script
-        ssh_executor.upload_file(f'/tmp/{prepid}_upload.sh',
-                                 f'{remote_directory}/config_upload.sh')
-        # Upload python script used by upload script
-        ssh_executor.upload_file('./core_lib/utils/config_uploader.py',
-                                 f'{remote_directory}/config_uploader.py')
-
-        os.remove(f'/tmp/{prepid}_generate.sh')
-        os.remove(f'/tmp/{prepid}_upload.sh')
-
-    def __check_for_submission(self, relval):
-        """
-        Perform one last check of values before submitting a RelVal
+    @staticmethod
+    def get_job_name(prepids):
         """
-        self.logger.debug('Performing one last check for %s', relval.get_prepid())
-        if relval.get('status') != 'submitting':
-            raise Exception(f'Cannot submit a request with status {relval.get("status")}')
-
-    def __generate_configs(self, relval, ssh_executor, remote_directory):
-        """
-        SSH to a remote machine and generate cmsDriver config files
+        Return job name of an item with given RelVals
         """
-        prepid = relval.get_prepid()
-        command = [f'cd {remote_directory}',
-                   'chmod +x config_generate.sh',
-                   'voms-proxy-init -voms cms --valid 4:00 --out $(pwd)/proxy.txt',
-                   'export X509_USER_PROXY=$(pwd)/proxy.txt',
-                   './config_generate.sh']
-        stdout, stderr, exit_code = ssh_executor.execute_command(command)
-        self.logger.debug('Exit code %s for %s config generation', exit_code, prepid)
-        if exit_code != 0:
-            raise Exception(f'Error generating configs for {prepid}.\n{stderr}')
+        if len(prepids) == 1:
+            return prepids[0]
 
-        return stdout
+        return f'{prepids[0]} and {len(prepids) - 1} more'
 
-    def __upload_configs(self, relval, ssh_executor, remote_directory):
+    def get_submit_batch(self, controller, cmssw_release, relvals):
         """
-        SSH to a remote machine and upload cmsDriver config files to ReqMgr2
+        Move RelVals to submit stage in submission queue and return job name and
+        item of one submit stage batch
+        Relvals is a dictionary of prepids and data of their submission, either
+        config hashes and cached configs or name of a workflow that is reused
         """
-        prepid = relval.get_prepid()
-        command = [f'cd {remote_directory}',
-                   'chmod +x config_upload.sh',
-                   'export X509_USER_PROXY=$(pwd)/proxy.txt',
-                   './config_upload.sh']
-        stdout, stderr, exit_code = ssh_executor.execute_command(command)
-        self.logger.debug('Exit code %s for %s config upload', exit_code, prepid)
-        if exit_code != 0:
-            raise Exception(f'Error uploading configs for {prepid}.\n{stderr}')
-
-        stdout = [x for x in clean_split(stdout, '\n') if 'DocID' in x]
-        # Get all lines that have DocID as tuples split by space
-        stdout = [tuple(clean_split(x.strip(), ' ')[1:]) for x in stdout]
-        return stdout
-
-    def __update_steps_with_config_hashes(self, relval, config_hashes):
-        """
-        Iterate through RelVal steps and set config_id values
-        """
-        for step in relval.get('steps'):
-            step_config_name = step.get_config_file_name()
-            if not step_config_name:
-                continue
-
-            step_name = step.get('name')
-            for config_pair in config_hashes:
-                config_name, config_hash = config_pair
-                if step_config_name == config_name:
-                    step.set('config_id', config_hash)
-                    config_hashes.remove(config_pair)
-                    self.logger.debug('Set %s %s for %s',
-                                      config_name,
-                                      config_hash,
-                                      step_name)
-                    break
-            else:
-                raise Exception(f'Could not find hash for {step_name}')
-
-        if config_hashes:
-            raise Exception(f'Unused hashes: {config_hashes}')
-
-        for step in relval.get('steps'):
-            step_config_name = step.get_config_file_name()
-            if not step_config_name:
-                continue
-
-            if not step.get('config_id'):
-                step_name = step.get('name')
-                raise Exception(f'Missing hash for step {step_name}')
-
-    def submit_relval(self, relval, controller):
-        """
-        Method that is used by submission workers. This is where the actual submission happens
-        """
-        prepid = relval.get_prepid()
-        credentials_file = Config.get('credentials_path')
-        ssh_executor = SSHExecutor('lxplus.cern.ch', credentials_file)
-        remote_directory = Config.get('remote_path').rstrip('/')
-        remote_directory = f'{remote_directory}/{prepid}'
-        prepid = relval.get_prepid()
-        self.logger.debug('Will try to acquire lock for %s', prepid)
-        with Locker().get_lock(prepid):
-            self.logger.info('Locked %s for submission', prepid)
-            relval_db = Database('relvals')
-            relval = controller.get(prepid)
-            try:
-                self.__check_for_submission(relval)
-                self.__prepare_workspace(relval, controller, ssh_executor, remote_directory)
-                # Start executing commands
-                # Create configs
-                self.__generate_configs(relval, ssh_executor, remote_directory)
-                # Upload configs
-                config_hashes = self.__upload_configs(relval, ssh_executor, remote_directory)
-                # Iterate through uploaded configs and save their hashes in RelVal steps
-                self.__update_steps_with_config_hashes(relval, config_hashes)
-                # Submit job dict to ReqMgr2
-                job_dict = controller.get_job_dict(relval)
-                cmsweb_url = Config.get('cmsweb_url')
-                grid_cert = Config.get('grid_user_cert')
-                grid_key = Config.get('grid_user_key')
-                connection = ConnectionWrapper(host=cmsweb_url,
-                                               keep_open=True,
-                                               cert_file=grid_cert,
-                                               key_file=grid_key)
-                workflow_name = self.submit_job_dict(job_dict, connection)
-                # Update RelVal after successful submission
-                relval.set('workflows', [{'name': workflow_name}])
-                relval.set('status', 'submitted')
-                relval.add_history('submission', 'succeeded', 'automatic')
-                relval_db.save(relval.get_json())
-                time.sleep(3)
-                self.approve_workflow(workflow_name, connection)
-                connection.close()
-                ssh_executor.execute_command([f'rm -rf {remote_directory}'])
-                controller.force_stats_to_refresh([workflow_name])
-            except Exception as ex:
-                self.__handle_error(relval, str(ex))
-                return
-
-            self.__handle_success(relval)
+        submission_queue = SubmissionQueue()
+        for prepid, data in relvals.items():
+            submission_queue.set_stage(prepid, 'submit', dict(data, cmssw_release=cmssw_release))
 
-        controller.update_workflows(relval)
-        self.logger.info('Successfully finished %s submission', prepid)
+        prepids = list(relvals)
+        return (self.get_job_name(prepids), {'controller': controller,
+                                               'cmssw_release': cmssw_release,
+                                               'prepids': prepids,
+                                               'relvals': relvals})
@@ -0,0 +1,72 @@
+"""
+Module that contains VOMSProxy class
+"""
+import time
+import logging
+from threading import Lock
+from core_lib.utils.global_config import Config
+from core_lib.utils.common_utils import clean_split
+
+
+class VOMSProxy():
+    """
+    Shared grid proxy in the remote area
+    Proxy is renewed only when it's remaining lifetime is shorter than minimum
+    lifetime, remaining lifetime is remembered, so valid proxy does not need
+    to be checked on the remote machine
+    """
+
+    # Host to time when proxy on that host expires
+    __expires = {}
+    __lock = Lock()
+
+    def __init__(self):
+        self.logger = logging.getLogger()
+        remote_directory = Config.get('remote_path').rstrip('/')
+        self.directory = f'$HOME/{remote_directory}/proxy'
+        self.path = f'{self.directory}/x509_proxy'
+
+    def get_export_command(self):
+        """
+        Return command that makes grid tools use the shared proxy
+        """
+        return f'export X509_USER_PROXY={self.path}'
+
+    def ensure(self, executor, timeout=None):
+        """
+        Make sure that shared proxy will be valid for at least minimum lifetime,
+        renew it if it will not
+        """
+        min_lifetime = int(Config.get('voms_proxy_min_lifetime') or 3600)
+        with VOMSProxy.__lock:
+            if VOMSProxy.__expires.get(executor.host, 0) - time.time() > min_lifetime:
+                return
+
+            validity = Config.get('voms_proxy_validity') or '24:00'
+            time_limit = f'timeout {timeout} ' if timeout else ''
+            # Other processes might renew proxy at the same time, so renewal is locked
+            command = [f'mkdir -p {self.directory}',
+                       f'exec {{PROXY_LOCK}}>{self.path}.lock',
+                       'flock -x $PROXY_LOCK',
+                       f'TIME_LEFT=$(voms-proxy-info -file {self.path} -timeleft 2>/dev/null '
+                       '|| echo 0)',
+                       f'if [ "$TIME_LEFT" -le {min_lifetime} ]; then '
+                       f'{time_limit}voms-proxy-init -voms cms --valid {validity} '
+                       f'--out {self.path}.new || exit $?; '
+                       f'mv -f {self.path}.new {self.path}; '
+                       f'TIME_LEFT=$(voms-proxy-info -file {self.path} -timeleft); fi',
+                       'echo "ProxyTimeLeft: $TIME_LEFT"']
+            stdout, stderr, exit_code = executor.execute_command(command, retry=True)
+            if exit_code != 0:
+                raise Exception(f'Error creating proxy.\n{stderr}')
+
+            for line in clean_split(stdout, '\n'):
+                if line.startswith('ProxyTimeLeft:'):
+                    time_left = int(clean_split(line, ' ')[1])
+                    self.logger.info('Shared proxy on %s is valid for %ss',
+                                     executor.host,
+                                     time_left)
+                    VOMSProxy.__expires[executor.host] = time.time() + time_left
+                    break
+            else:
+                raise Exception(f'Could not get remaining lifetime of proxy.\n{stdout}')
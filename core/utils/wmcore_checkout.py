@@ -0,0 +1,104 @@
+"""
+Module that contains WMCoreCheckout class
+"""
+import time
+import logging
+from threading import Thread, Lock
+from core_lib.utils.global_config import Config
+from core.utils.executor_pool import ExecutorPool
+
+
+class WMCoreCheckout():
+    """
+    Shared WMCore checkout in the remote area
+    Each checkout is a directory of a pinned WMCore version that is pointed to
+    by a symlink, so it can be refreshed without breaking uploads that are using it
+    """
+
+    __refresh_thread = None
+    __refresh_lock = Lock()
+
+    def __init__(self):
+        self.logger = logging.getLogger()
+        self.version = Config.get('wmcore_version') or '2.3.0'
+        remote_directory = Config.get('remote_path').rstrip('/')
+        self.directory = f'$HOME/{remote_directory}/wmcore'
+        self.link = f'{self.directory}/{self.version}'
+
+    def __get_clone_commands(self):
+        """
+        Return commands that clone WMCore to a new directory and point the symlink to it
+        """
+        return [f'mkdir -p {self.directory}',
+                f'WMCORE_NEW={self.link}-$(date +%s)-$$',
+                f'git clone --quiet --depth 1 --branch {self.version} '
+                'https://github.com/dmwm/WMCore.git $WMCORE_NEW || exit $?',
+                f'ln -sfn $WMCORE_NEW {self.link}']
+
+    def get_setup_script(self):
+        """
+        Return bash script that adds shared WMCore checkout to PYTHONPATH
+        Checkout is created if it does not exist
+        """
+        script = f'if [ ! -d {self.link}/src/python ]; then\n'
+        script += '\n'.join(f'  {command}' for command in self.__get_clone_commands())
+        script += '\nfi\n'
+        script += f'WMCORE_DIR=$(readlink -f {self.link})\n'
+        script += 'export PYTHONPATH=$WMCORE_DIR/src/python/:$PYTHONPATH\n'
+        return script
+
+    def refresh(self):
+        """
+        Clone a fresh checkout of the pinned version, point the symlink to it
+        and remove old checkouts of the version
+        Checkout that symlink pointed to before is kept until the next refresh,
+        because uploads that started before this refresh might still be using it
+        """
+        command = [f'WMCORE_PREVIOUS=$(readlink -f {self.link})']
+        command += self.__get_clone_commands()
+        command += [f'WMCORE_CURRENT=$(readlink -f {self.link})',
+                    f'for CHECKOUT in $(find {self.directory} -maxdepth 1 -mindepth 1 -type d '
+                    f'-name "{self.version}-*"); do',
+                    '  if [ "$CHECKOUT" != "$WMCORE_CURRENT" ] && '
+                    '[ "$CHECKOUT" != "$WMCORE_PREVIOUS" ]; then rm -rf $CHECKOUT; fi',
+                    'done']
+        self.logger.info('Refreshing WMCore %s checkout', self.version)
+        # Each host might have it's own home directory
+        executor_pool = ExecutorPool()
+        errors = []
+        for host in executor_pool.get_hosts():
+            with executor_pool.borrow(host) as executor:
+                _, stderr, exit_code = executor.execute_command(['\n'.join(command)], retry=True)
+
+            if exit_code != 0:
+                errors.append(f'{host}: {stderr}')
+
+        if errors:
+            errors = '\n'.join(errors)
+            raise Exception(f'Error refreshing WMCore checkout: {errors}')
+
+    def start_refresh(self):
+        """
+        Start a background thread that periodically refreshes the checkout
+        """
+        with WMCoreCheckout.__refresh_lock:
+            if WMCoreCheckout.__refresh_thread is not None:
+                return
+
+            interval = int(Config.get('wmcore_refresh_interval') or 86400)
+            thread = Thread(target=self.__refresh_loop, args=(interval, ), name='wmcore-refresh')
+            thread.daemon = True
+            thread.start()
+            WMCoreCheckout.__refresh_thread = thread
+
+    def __refresh_loop(self, interval):
+        """
+        Refresh the checkout and wait for the given interval
+        """
+        while True:
+            try:
+                self.refresh()
+            except Exception as ex:
+                self.logger.error('Error refreshing WMCore checkout: %s', ex)
+
+            time.sleep(interval)
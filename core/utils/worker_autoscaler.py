@@ -0,0 +1,160 @@
+"""
+Module that contains WorkerAutoscaler class
+"""
+import time
+import logging
+from collections import deque
+from threading import Thread, Lock
+from core_lib.utils.global_config import Config
+from core.utils.host_balancer import HostBalancer
+
+
+class WorkerAutoscaler():
+    """
+    Process-wide controller that periodically changes number of workers of
+    submission stages between "submission_{stage}_min_workers" and
+    "submission_{stage}_max_workers"
+    Stage gets a worker more if it's queued items would wait too long and a worker
+    less if it's workers are idle or, for stages that run remote jobs, if too many
+    remote jobs fail, e.g. because remote hosts are overloaded
+    """
+
+    # Stage name to signals and bounds of the last evaluation
+    __stages = {}
+    # Recent changes of number of workers
+    __decisions = deque(maxlen=100)
+    __lock = Lock()
+    __thread = None
+
+    def __init__(self):
+        self.logger = logging.getLogger()
+
+    def start(self, stages, remote_stages):
+        """
+        Start a background thread that periodically scales given stages
+        Remote stages are also scaled by error rate of remote jobs
+        Bounds default to the initial number of workers of each stage
+        """
+        with WorkerAutoscaler.__lock:
+            if WorkerAutoscaler.__thread is not None:
+                return
+
+            initial = {stage.name: stage.get_workers() for stage in stages}
+            interval = int(Config.get('submission_autoscale_interval') or 30)
+            thread = Thread(target=self.__scale_loop,
+                            args=(stages, remote_stages, initial, interval),
+                            name='worker-autoscaler')
+            thread.daemon = True
+            thread.start()
+            WorkerAutoscaler.__thread = thread
+
+    def __scale_loop(self, stages, remote_stages, initial, interval):
+        """
+        Scale all stages and wait for the given interval
+        """
+        while True:
+            time.sleep(interval)
+            window = int(Config.get('submission_autoscale_error_window') or 300)
+            error_rate = HostBalancer().get_error_rate(window)
+            for stage in stages:
+                try:
+                    self.scale(stage,
+                               initial[stage.name],
+                               error_rate if stage.name in remote_stages else None)
+                except Exception as ex:
+                    self.logger.error('Error scaling %s stage: %s', stage.name, ex)
+
+    @staticmethod
+    def __decide(workers, bounds, signals):
+        """
+        Return new number of workers and reason of the change or None if number
+        of workers should not change
+        """
+        min_workers, max_workers = bounds
+        if workers < min_workers:
+            return min_workers, 'below minimum'
+
+        if workers > max_workers:
+            return max_workers, 'above maximum'
+
+        max_error_rate = float(Config.get('submission_autoscale_max_error_rate') or 0.2)
+        error_rate = signals['error_rate']
+        if error_rate is not None and error_rate > max_error_rate:
+            # Remote hosts are struggling, more workers would make it worse
+            if workers > min_workers:
+                return workers - 1, f'remote error rate is {error_rate:.0%}'
+
+            return None
+
+        return WorkerAutoscaler.__decide_by_load(workers, bounds, signals)
+
+    @staticmethod
+    def __decide_by_load(workers, bounds, signals):
+        """
+        Return new number of workers and reason of the change based on queue depth
+        and latency of jobs or None if number of workers should not change
+        """
+        min_workers, max_workers = bounds
+        queued = signals['queued']
+        busy = signals['active'] >= workers
+        # Without finished jobs each queued item is assumed to take a full timeout
+        duration = signals['mean_duration'] or signals['timeout'] or 0
+        expected_wait = queued / workers * duration
+        target_wait = float(Config.get('submission_autoscale_target_wait') or 60)
+        if queued and busy and expected_wait > target_wait and workers < max_workers:
+            return workers + 1, f'{queued} queued items would wait {int(expected_wait)}s'
+
+        idle = workers - signals['active']
+        if not queued and idle > 1 and workers > min_workers:
+            return workers - 1, f'{idle} workers are idle'
+
+        return None
+
+    def scale(self, stage, initial, error_rate=None):
+        """
+        Add or remove one worker of a stage based on it's queue depth, latency of
+        it's jobs and error rate of remote jobs
+        """
+        min_workers = int(Config.get(f'submission_{stage.name}_min_workers') or initial)
+        max_workers = int(Config.get(f'submission_{stage.name}_max_workers') or initial)
+        max_workers = max(min_workers, max_workers)
+        status = stage.get_status()
+        mean_duration = stage.get_mean_duration()
+        signals = {'queued': status['queued'],
+                   'active': status['active'],
+                   'mean_duration': round(mean_duration, 1) if mean_duration else None,
+                   'timeout': stage.timeout,
+                   'error_rate': round(error_rate, 3) if error_rate is not None else None}
+        workers = status['workers']
+        decision = self.__decide(workers, (min_workers, max_workers), signals)
+        with WorkerAutoscaler.__lock:
+            WorkerAutoscaler.__stages[stage.name] = dict(signals,
+                                                         workers=workers,
+                                                         min_workers=min_workers,
+                                                         max_workers=max_workers)
+
+        if decision is None:
+            return
+
+        new_workers, reason = decision
+        self.logger.info('Scaling %s stage from %s to %s workers: %s',
+                         stage.name,
+                         workers,
+                         new_workers,
+                         reason)
+        stage.set_workers(new_workers)
+        with WorkerAutoscaler.__lock:
+            WorkerAutoscaler.__stages[stage.name]['workers'] = new_workers
+            WorkerAutoscaler.__decisions.append({'time': int(time.time()),
+                                                 'stage': stage.name,
+                                                 'from': workers,
+                                                 'to': new_workers,
+                                                 'reason': reason})
+
+    def get_status(self):
+        """
+        Return bounds and signals of each stage and recent scaling decisions, newest first
+        """
+        with WorkerAutoscaler.__lock:
+            return {'stages': {k: dict(v) for k, v in WorkerAutoscaler.__stages.items()},
+                    'decisions': list(reversed(WorkerAutoscaler.__decisions))}
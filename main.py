@@ -1,6 +1,7 @@
 """
 Main module that starts flask web server
 """
+import os
 import logging
 import argparse
 from flask_restful import Api
@@ -13,6 +14,11 @@ from api.system_api import (LockerStatusAPI,
                             UserInfoAPI,
                             SubmissionWorkerStatusAPI,
                             SubmissionQueueAPI,
+                            CancelSubmissionAPI,
+                            ConfigCacheStatusAPI,
+                            SubmissionMetricsAPI,
+                            RemoteHostsStatusAPI,
+                            RateLimiterStatusAPI,
                             ObjectsInfoAPI)
 from api.search_api import SearchAPI, SuggestionsAPI, WildSearchAPI
 from api.ticket_api import (CreateTicketAPI,
@@ -36,6 +42,10 @@ from api.relval_api import (CreateRelValAPI,
                             RelValPreviousStatus,
                             UpdateRelValWorkflowsAPI)
 from api.settings_api import SettingsAPI
+from core.controller.relval_controller import RelValController
+from core.utils.submitter import RequestSubmitter
+from core.utils.wmcore_checkout import WMCoreCheckout
+from core.utils.cmssw_area_cache import CMSSWAreaCache
 
 log_format = '[%(asctime)s][%(levelname)s] %(message)s'
 logging.basicConfig(format=log_format, level=logging.DEBUG)
@@ -105,6 +115,11 @@ api.add_resource(LockerStatusAPI, '/api/system/locks')
 api.add_resource(UserInfoAPI, '/api/system/user_info')
 api.add_resource(SubmissionWorkerStatusAPI, '/api/system/workers')
 api.add_resource(SubmissionQueueAPI, '/api/system/queue')
+api.add_resource(CancelSubmissionAPI, '/api/system/cancel_submission/<string:prepid>')
+api.add_resource(ConfigCacheStatusAPI, '/api/system/config_cache')
+api.add_resource(SubmissionMetricsAPI, '/api/system/submission_metrics')
+api.add_resource(RemoteHostsStatusAPI, '/api/system/remote_hosts')
+api.add_resource(RateLimiterStatusAPI, '/api/system/rate_limits')
 api.add_resource(ObjectsInfoAPI, '/api/system/objects_info')
 
 api.add_resource(SettingsAPI,
@@ -176,6 +191,13 @@ def main():
     debug = args.get('debug', False)
     port = int(config.get('port', 8005))
     host = config.get('host', '0.0.0.0')
+    # In debug mode only the reloaded process should resume submissions
+    # and maintain WMCore checkout and CMSSW areas
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        RequestSubmitter().resume(RelValController())
+        WMCoreCheckout().start_refresh()
+        CMSSWAreaCache().start_cleanup()
+
     app.run(host=host,
             port=port,
             threaded=True,